@@ -0,0 +1,86 @@
+# Benchmark de compresión: CPU consumido frente a bytes ahorrados en catálogos realistas.
+#
+# Uso: python -m benchmarks.compression [--products 500 2000 10000] [--repeat 5]
+import argparse
+import json
+import random
+import time
+
+from utils import compression
+from utils.compression import compress_body
+
+CATEGORIES = ["Electrónica", "Hogar", "Deportes", "Moda", "Juguetes", "Belleza", "Libros"]
+BRANDS = ["Samsung", "LG", "Nike", "Adidas", "Sony", "Xiaomi", "Philips", "Lego", "Mattel"]
+WORDS = (
+    "calidad premium nuevo original garantía envío rápido color negro blanco azul "
+    "resistente ligero compacto inalámbrico recargable acero algodón talla modelo "
+    "edición especial diseño moderno ideal para regalo uso diario oficina casa"
+).split()
+
+
+def build_catalogue(products: int, seed: int = 42):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(1, products + 1):
+        rows.append({
+            "id_product": i,
+            "product_name": " ".join(rnd.choices(WORDS, k=3)).title(),
+            "product_description": " ".join(rnd.choices(WORDS, k=rnd.randint(12, 40))),
+            "product_image": f"https://commette.blob.core.windows.net/products/{i}/{rnd.getrandbits(64):016x}.jpg",
+            "category_name": rnd.choice(CATEGORIES),
+            "brand_name": rnd.choice(BRANDS),
+            "id_category": rnd.randint(1, len(CATEGORIES)),
+            "id_brand": rnd.randint(1, len(BRANDS)),
+            "id_user": rnd.randint(1, 200),
+            "price": round(rnd.uniform(1, 2500), 2),
+            "stock": rnd.randint(0, 500),
+        })
+    return json.dumps(rows).encode("utf-8")
+
+
+def measure(body: bytes, encoding: str, repeat: int):
+    best = float("inf")
+    compressed = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compressed = compress_body(body, encoding)
+        best = min(best, time.perf_counter() - start)
+    return best, len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, nargs="+", default=[500, 2000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    levels = {"gzip": [1, 6, 9]}
+    if compression.brotli is not None:
+        levels["br"] = [1, 5, 9]
+    if compression.zstandard is not None:
+        levels["zstd"] = [1, 3, 9]
+
+    print(f"{'productos':>9} {'algoritmo':>9} {'nivel':>5} {'original':>10} {'comprimido':>10} "
+          f"{'ratio':>6} {'ms':>8} {'MB/s':>8} {'KB ahorrados/ms CPU':>20}")
+    for products in args.products:
+        body = build_catalogue(products)
+        for encoding, encoding_levels in levels.items():
+            attribute = {
+                "gzip": "COMPRESSION_GZIP_LEVEL",
+                "br": "COMPRESSION_BROTLI_LEVEL",
+                "zstd": "COMPRESSION_ZSTD_LEVEL",
+            }[encoding]
+            original_level = getattr(compression, attribute)
+            for level in encoding_levels:
+                setattr(compression, attribute, level)
+                seconds, size = measure(body, encoding, args.repeat)
+                ms = seconds * 1000
+                saved_kb = (len(body) - size) / 1024
+                print(f"{products:>9} {encoding:>9} {level:>5} {len(body):>10} {size:>10} "
+                      f"{len(body) / size:>6.2f} {ms:>8.2f} {len(body) / seconds / 1e6:>8.1f} "
+                      f"{saved_kb / ms:>20.1f}")
+            setattr(compression, attribute, original_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Benchmark de validación: validaciones por segundo de los modelos de usuario.
+#
+# Compara los modelos actuales (tipos anotados de models/validation.py) con la
+# versión anterior basada en @validator, con cuerpos válidos e inválidos.
+#
+# Uso: python -m benchmarks.validation [--number 20000] [--repeat 5]
+import re
+import time
+import argparse
+import warnings
+
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+
+from models.UserLogin import UserLogin
+from models.UserRegister import UserRegister
+from models.UserActivation import UserActivation
+from utils.globalf import validate_sql_injection
+
+PAYLOADS = {
+    "UserLogin": {
+        "válido": {"email": "ana.perez@example.com", "password": "Secreta!Clave"},
+        "password inválido": {"email": "ana.perez@example.com", "password": "secreta1234"},
+    },
+    "UserRegister": {
+        "válido": {
+            "email": "ana.perez@example.com",
+            "password": "Secreta!Clave",
+            "firstname": "Ana",
+            "lastname": "Pérez",
+            "username": "ana_perez",
+            "companyName": "Comercial Pérez",
+        },
+        "username inválido": {
+            "email": "ana.perez@example.com",
+            "password": "Secreta!Clave",
+            "firstname": "Ana",
+            "lastname": "Pérez",
+            "username": "ana'; select",
+        },
+    },
+    "UserActivation": {
+        "válido": {"email": "ana.perez@example.com", "code": 123456},
+        "email inválido": {"email": "ana.perez", "code": 123456},
+    },
+}
+
+
+# Versión anterior, para comparar.
+def legacy_validate_sql_injection(data):
+    dangerous_keywords = ["exec", "EXEC", "select", "SELECT"]
+    if any(keyword in data for keyword in dangerous_keywords):
+        return True
+    if any(char in data for char in ["'", ";", "--", "/*", "*/", "@", "`", '"']):
+        return True
+    return False
+
+
+def legacy_models():
+    from pydantic import validator
+
+    def password_validation(cls, value):
+        if len(value) < 6:
+            raise ValueError('Password must be at least 6 characters long')
+        if not re.search(r'[A-Z]', value):
+            raise ValueError('Password must contain at least one uppercase letter')
+        if not re.search(r'[\W_]', value):
+            raise ValueError('Password must contain at least one special character')
+        if re.search(r'(012|123|234|345|456|567|678|789|890)', value):
+            raise ValueError('Password must not contain a sequence of numbers')
+        return value
+
+    def email_validation(cls, value):
+        if not re.match(r"[^@]+@[^@]+\.[^@]+", value):
+            raise ValueError('Invalid email address')
+        return value
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        class LegacyUserLogin(BaseModel):
+            email: str
+            password: str
+            _password = validator('password', allow_reuse=True)(password_validation)
+            _email = validator('email', allow_reuse=True)(email_validation)
+
+        class LegacyUserRegister(BaseModel):
+            email: str
+            password: str
+            firstname: str
+            lastname: str
+            username: str
+            companyName: Optional[str] = None
+            _password = validator('password', allow_reuse=True)(password_validation)
+            _email = validator('email', allow_reuse=True)(email_validation)
+
+            @validator('firstname', 'lastname')
+            def name_validation(cls, value):
+                if legacy_validate_sql_injection(value):
+                    raise ValueError('Invalid name')
+                return value
+
+            @validator('username')
+            def username_validation(cls, value):
+                if legacy_validate_sql_injection(value):
+                    raise ValueError('Invalid username')
+                if len(value) < 3:
+                    raise ValueError('Username must be at least 3 characters long')
+                if not re.match(r'^[a-zA-Z0-9_]+$', value):
+                    raise ValueError('Username can only contain alphanumeric characters and underscores')
+                return value
+
+            @validator('companyName', always=True)
+            def company_name_validation(cls, value, values):
+                if values.get('is_seller') and not value:
+                    raise ValueError('Company name must be provided for sellers')
+                return value
+
+        class LegacyUserActivation(BaseModel):
+            email: str
+            code: int
+            _email = validator('email', allow_reuse=True)(email_validation)
+
+    return {
+        "UserLogin": LegacyUserLogin,
+        "UserRegister": LegacyUserRegister,
+        "UserActivation": LegacyUserActivation,
+    }
+
+
+def measure(func, payload, number: int, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            try:
+                func(payload)
+            except ValidationError:
+                pass
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    current = {"UserLogin": UserLogin, "UserRegister": UserRegister, "UserActivation": UserActivation}
+    legacy = legacy_models()
+
+    print(f"{'modelo':>15} {'cuerpo':>18} {'anterior/s':>12} {'actual/s':>12} {'mejora':>7}")
+    for name, payloads in PAYLOADS.items():
+        for label, payload in payloads.items():
+            before = measure(legacy[name].model_validate, payload, args.number, args.repeat)
+            after = measure(current[name].model_validate, payload, args.number, args.repeat)
+            print(f"{name:>15} {label:>18} {before:>12,.0f} {after:>12,.0f} {after / before:>6.2f}x")
+
+    for text in ("Comercial Pérez", "x'; EXEC xp_cmdshell --"):
+        before = measure(legacy_validate_sql_injection, text, args.number * 5, args.repeat)
+        after = measure(validate_sql_injection, text, args.number * 5, args.repeat)
+        print(f"{'sql_injection':>15} {text[:18]:>18} {before:>12,.0f} {after:>12,.0f} {after / before:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import json
+import asyncio
+import logging
+
+from urllib.parse import urlsplit
+
+from fastapi import Request
+from starlette.exceptions import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+
+from utils.database import shared_read_connection
+from models.Batch import BatchItem
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo del cuerpo de cada subrespuesta.
+batch_max_response_bytes = int(os.getenv("BATCH_MAX_RESPONSE_BYTES", str(5 * 1024 * 1024)))
+# Encabezados de la subrespuesta que se devuelven al cliente.
+batch_response_headers = ("etag", "cache-control", "content-type")
+# Encabezados de la petición original que no se propagan a las subpeticiones.
+batch_skip_headers = {b"content-length", b"content-type", b"accept-encoding", b"transfer-encoding"}
+# Rutas de streaming (SSE, exportaciones): no terminan o no caben en una subrespuesta.
+batch_streaming_paths = {"/products/stream", "/products/export"}
+
+
+class _ResponseTooLarge(Exception):
+    pass
+
+
+def _sub_scope(parent: dict, item: BatchItem, claims: dict):
+    parts = urlsplit(item.path)
+    headers = [(k, v) for k, v in parent["headers"] if k not in batch_skip_headers]
+    return {
+        **parent,
+        "method": "GET",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "headers": headers,
+        # Las subpeticiones llegan ya autenticadas: `validate` no vuelve a decodificar el JWT.
+        "state": {**claims, "authenticated": True},
+    }
+
+
+async def _dispatch(router, scope: dict):
+    status = 500
+    headers = []
+    body = bytearray()
+    request_sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        # El cuerpo vacío se entrega una vez; después se bloquea hasta que la
+        # subrespuesta termina, como un cliente que sigue conectado.
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            headers = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+            if len(body) > batch_max_response_bytes:
+                raise _ResponseTooLarge()
+
+    try:
+        await router(scope, receive, send)
+    finally:
+        finished.set()
+    return status, headers, bytes(body)
+
+
+def _decode(headers, body: bytes):
+    content_type = ""
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            content_type = value.decode("latin-1")
+    if not body:
+        return None
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    return body.decode("utf-8", errors="replace")
+
+
+async def _run_item(router, parent: dict, item: BatchItem, claims: dict):
+    if item.method.upper() != "GET":
+        return {"id": item.id, "status": 405, "body": {"detail": "Only GET sub-requests are allowed"}}
+    path = urlsplit(item.path).path.rstrip("/")
+    if not item.path.startswith("/") or path == "/batch":
+        return {"id": item.id, "status": 400, "body": {"detail": "Invalid sub-request path"}}
+    if path in batch_streaming_paths:
+        return {"id": item.id, "status": 400, "body": {"detail": "Streaming endpoints are not allowed in a batch"}}
+
+    try:
+        status, headers, body = await _dispatch(router, _sub_scope(parent, item, claims))
+        result = {"id": item.id, "status": status, "body": _decode(headers, body)}
+        result["headers"] = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in headers
+            if name.decode("latin-1").lower() in batch_response_headers
+        }
+        return result
+    except HTTPException as e:
+        return {"id": item.id, "status": e.status_code, "body": {"detail": e.detail}}
+    except RequestValidationError as e:
+        return {"id": item.id, "status": 422, "body": {"detail": jsonable_encoder(e.errors())}}
+    except _ResponseTooLarge:
+        return {"id": item.id, "status": 413, "body": {"detail": "Sub-response too large"}}
+    except Exception as e:
+        logger.error(f"Error in batch sub-request {item.path}: {e}")
+        return {"id": item.id, "status": 500, "body": {"detail": "Internal Server Error"}}
+
+
+async def run_batch(request: Request, items):
+    """Ejecuta varias peticiones GET contra las rutas existentes en una sola llamada.
+
+    El JWT se valida una vez para todo el lote, las subpeticiones se atienden de
+    forma concurrente directamente en el router (sin repetir los middlewares) y
+    comparten una conexión de lectura mientras esté libre.
+    """
+    claims = {
+        "id_user": request.state.id_user,
+        "email": request.state.email,
+        "firstname": request.state.firstname,
+        "lastname": request.state.lastname,
+        "role": request.state.role,
+    }
+    router = request.app.router
+    with shared_read_connection() as shared:
+        responses = await asyncio.gather(*[
+            _run_item(router, request.scope, item, claims) for item in items
+        ])
+    logger.debug(f"Batch of {len(items)} requests reused the shared connection {shared.reused} times")
+    return {"responses": responses}
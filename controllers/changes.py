@@ -0,0 +1,178 @@
+import os
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from utils.database import get_db_connection, rows_as_dicts
+from controllers.product import fetch_product_info
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cambios devueltos como máximo por llamada; el cliente pide la siguiente página con el token.
+changes_page_size = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+# Antigüedad a partir de la cual se purgan tombstones y cada cuánto se compacta (0 = nunca).
+change_log_retention_days = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+change_log_compact_seconds = float(os.getenv("CHANGE_LOG_COMPACT_SECONDS", "3600"))
+
+_compact_task = None
+
+
+def parse_sync_token(token: str):
+    if token is None:
+        return None
+    try:
+        value = int(token)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    if value < 0:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return value
+
+
+def _read_changes(cursor, since: int):
+    # Todas las lecturas se limitan a versiones ya confirmadas (< MIN_ACTIVE_ROWVERSION).
+    cursor.execute(
+        """
+        SET NOCOUNT ON;
+        DECLARE @since BINARY(8) = CAST(CAST(%d AS BIGINT) AS BINARY(8));
+        DECLARE @upper BINARY(8) = MIN_ACTIVE_ROWVERSION();
+        SELECT pruned_through, CAST(@upper AS BIGINT) - 1
+        FROM [commette].[ProductChangeLogState] WHERE id = 1;
+        SELECT TOP (%d) c.id_product, c.operation, CAST(c.change_version AS BIGINT)
+        FROM [commette].[ProductChangeLog] c
+        WHERE c.change_version > @since AND c.change_version < @upper
+          AND NOT EXISTS (
+              SELECT 1 FROM [commette].[ProductChangeLog] n
+              WHERE n.id_product = c.id_product
+                AND n.change_version > c.change_version AND n.change_version < @upper
+          )
+        ORDER BY c.change_version;
+        """,
+        (since, changes_page_size + 1)
+    )
+    pruned_through, current = cursor.fetchone()
+    changes = []
+    if cursor.nextset():
+        changes = cursor.fetchall()
+    return pruned_through, current, changes
+
+
+def _read_products(cursor, product_ids):
+    # Un solo viaje: un EXEC por producto y un result set por cada uno.
+    cursor.execute(
+        "SET NOCOUNT ON;\n" + "\n".join(["EXEC commette.get_product_by_id @ProductID = %d;"] * len(product_ids)),
+        tuple(product_ids)
+    )
+    products = {}
+    for product_id in product_ids:
+        rows = rows_as_dicts(cursor)
+        if rows:
+            products[product_id] = rows[0]
+        if not cursor.nextset():
+            break
+    return products
+
+
+async def _full_resync(current: int):
+    # El token se toma antes de leer el catálogo: lo que cambie mientras tanto vuelve en la próxima llamada.
+    return {
+        "token": str(current),
+        "full_resync": True,
+        "has_more": False,
+        "products": await fetch_product_info(),
+        "deleted": [],
+    }
+
+
+async def fetch_product_changes(since: str = None):
+    """Productos creados, modificados o borrados después de `since`.
+
+    Sin token, o con uno anterior a los tombstones purgados, se devuelve el
+    catálogo completo con `full_resync = true` y un token nuevo.
+    """
+    since = parse_sync_token(since)
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        pruned_through, current, changes = _read_changes(cursor, since or 0)
+        if since is None or since < pruned_through:
+            resync = True
+        else:
+            resync = False
+            has_more = len(changes) > changes_page_size
+            changes = changes[:changes_page_size]
+            upserted = [product_id for product_id, operation, _ in changes if operation == "U"]
+            products = _read_products(cursor, upserted) if upserted else {}
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.discard()
+        logger.error(f"Error fetching product changes since {since}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        cursor.close()
+        conn.close()
+
+    if resync:
+        return await _full_resync(current)
+
+    # Un producto modificado y borrado antes de leerlo se entrega como baja.
+    deleted = [
+        product_id for product_id, operation, _ in changes
+        if operation == "D" or product_id not in products
+    ]
+    if has_more:
+        token = changes[-1][2]
+    else:
+        token = max(since, current)
+    return {
+        "token": str(token),
+        "full_resync": False,
+        "has_more": has_more,
+        "products": [products[product_id] for product_id, operation, _ in changes if product_id in products],
+        "deleted": deleted,
+    }
+
+
+async def compact_change_log():
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "EXEC commette.compact_product_changes @retention_days = %d",
+            (change_log_retention_days,)
+        )
+        conn.commit()
+    except Exception:
+        conn.discard()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+async def _compact_loop():
+    while True:
+        await asyncio.sleep(change_log_compact_seconds)
+        try:
+            await compact_change_log()
+        except Exception as e:
+            logger.error(f"Error compacting product change log: {e}")
+
+
+def start_change_log_compaction():
+    global _compact_task
+    if change_log_compact_seconds > 0 and _compact_task is None:
+        _compact_task = asyncio.create_task(_compact_loop())
+
+
+def stop_change_log_compaction():
+    global _compact_task
+    if _compact_task is not None:
+        _compact_task.cancel()
+        _compact_task = None
@@ -4,6 +4,8 @@ import json
 import logging
 import traceback
 import random
+import asyncio
+import jwt
 
 from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
@@ -14,9 +16,13 @@ import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
 from utils.database import fetch_query_as_json, get_db_connection
 from utils.security import create_jwt_token
+from utils.jwks import PublicKeyCache
+from utils.firebase_tokens import verify_firebase_id_token, UnverifiedEmailError
+from controllers.identity import issue_token_for_email
 from models.UserRegister import UserRegister
 from models.UserLogin import UserLogin
 from models.UserActivation import UserActivation
+from models.FirebaseLogin import FirebaseTokenLogin
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +43,14 @@ headers = {
     "X-Secret-Key": x_secret_key,
     "Content-Type": "application/json"
 }
+# Verificación local de ID tokens de Firebase con los certificados públicos de Google.
+firebase_project_id = os.getenv("FIREBASE_PROJECT_ID") or cred.project_id
+firebase_certs_url = os.getenv(
+    "FIREBASE_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+firebase_keys = PublicKeyCache(firebase_certs_url)
+
 queue_client = QueueClient.from_connection_string(azure_sak, queue_name)
 queue_client.message_decode_policy = BinaryBase64DecodePolicy()
 queue_client.message_encode_policy = BinaryBase64EncodePolicy()
@@ -189,6 +203,21 @@ async def login_user_firebase(user: UserLogin):
         )
  
     
+async def login_user_firebase_token(login: FirebaseTokenLogin):
+    # El cliente inicia sesión con Firebase y solo envía el ID token: no hay llamada remota por login.
+    try:
+        claims = await verify_firebase_id_token(login.idToken, firebase_keys, firebase_project_id)
+    except UnverifiedEmailError:
+        raise HTTPException(status_code=403, detail="Firebase account has no verified email")
+    except jwt.PyJWTError as e:
+        logger.info(f"Rejected Firebase ID token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid Firebase ID token")
+    except Exception as e:
+        logger.error(f"Error loading Firebase signing keys: {e}")
+        raise HTTPException(status_code=503, detail="Firebase signing keys unavailable")
+
+    return await issue_token_for_email(claims["email"])
+
 async def generate_activation_code(email: str):
 
     code = random.randint(100000, 999999)
@@ -221,6 +250,14 @@ async def check_exists(table: str, column: str, value: str) -> bool:
         conn.close()
 
 
+async def mark_email_verified(email: str):
+    def update():
+        user_record = firebase_auth.get_user_by_email(email)
+        if not user_record.email_verified:
+            firebase_auth.update_user(user_record.uid, email_verified=True)
+    await asyncio.to_thread(update)
+
+
 async def activate_user(user: UserActivation):
     query = f"""
             select 
@@ -249,6 +286,9 @@ async def activate_user(user: UserActivation):
                 """
         result_json = await fetch_query_as_json(query, is_procedure=True)
 
+        # El código de activación prueba el email: /login/firebase exige email_verified.
+        await mark_email_verified(user.email)
+
         return {
             "message": "Usuario activado exitosamente"
         }
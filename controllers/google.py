@@ -3,18 +3,30 @@ from fastapi import HTTPException, Request
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from starlette.responses import RedirectResponse, JSONResponse
 from urllib.parse import urlencode
-import requests
+import logging
+import jwt
 
 from dotenv import load_dotenv
+from utils.jwks import OpenIDProvider, post_form
+from controllers.identity import issue_token_for_email
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 google_client_id = os.getenv("GOOGLE_CLIENT_ID")
 google_client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
 google_redirect_uri = os.getenv("GOOGLE_REDIRECT_URI")
 
 google_authorization_url = "https://accounts.google.com/o/oauth2/auth"
 google_token_url = "https://oauth2.googleapis.com/token"
-userinfo_url = "https://openidconnect.googleapis.com/v1/userinfo"
+google_discovery_url = "https://accounts.google.com/.well-known/openid-configuration"
+
+# El id_token se valida localmente con el JWKS cacheado; no se llama al endpoint userinfo.
+google_provider = OpenIDProvider(
+    google_discovery_url,
+    google_client_id,
+    issuers=("https://accounts.google.com", "accounts.google.com"),
+)
 
 google_oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=google_authorization_url,
@@ -46,10 +58,9 @@ async def auth_callback_google(request: Request):
         "redirect_uri": google_redirect_uri,
     }
 
-    token_response = requests.post(google_token_url, data=token_data)
-    token_response_data = token_response.json()
+    _, token_response_data = await post_form(google_token_url, token_data)
 
-    if "access_token" not in token_response_data:
+    if "id_token" not in token_response_data:
         return JSONResponse(content={
                 "error": token_response_data.get("error")
                 , "error_description": token_response_data.get("error_description")
@@ -57,8 +68,22 @@ async def auth_callback_google(request: Request):
             , status_code=400
         )
 
-    access_token = token_response_data["access_token"]
-    userinfo_response = requests.get(userinfo_url, headers={"Authorization": f"Bearer {access_token}"})
-    userinfo_data = userinfo_response.json()
+    try:
+        claims = await google_provider.validate_id_token(token_response_data["id_token"])
+    except jwt.PyJWTError as e:
+        logger.info(f"Rejected Google id_token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid id_token")
+    except Exception as e:
+        logger.error(f"Error loading Google signing keys: {e}")
+        raise HTTPException(status_code=503, detail="Google signing keys unavailable")
 
-    return JSONResponse(content={"userinfo": userinfo_data})
\ No newline at end of file
+    if not claims.get("email") or not claims.get("email_verified"):
+        raise HTTPException(status_code=403, detail="Google account email is not verified")
+
+    result = await issue_token_for_email(claims["email"])
+    result["userinfo"] = {
+        key: claims[key]
+        for key in ("sub", "email", "email_verified", "name", "given_name", "family_name", "picture")
+        if key in claims
+    }
+    return JSONResponse(content=result)
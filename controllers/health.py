@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+
+import aiohttp
+from dotenv import load_dotenv
+
+from utils.database import ping_database, primary_pool, replica_pool
+from controllers.firebase import queue_client
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutiliza el resultado de /readyz para que los probes no multipliquen la carga.
+health_cache_ttl = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+# Tiempo máximo por dependencia antes de darla por caída.
+health_check_timeout = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Saturación del pool a partir de la cual la instancia deja de aceptar tráfico.
+health_pool_saturation_limit = float(os.getenv("HEALTH_POOL_SATURATION_LIMIT", "1.5"))
+
+tenant_id = os.getenv("TENANT_ID")
+
+# Endpoints de identidad: basta con que respondan (cualquier estado < 500).
+identity_endpoints = {
+    "firebase": "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+    "google": "https://accounts.google.com/.well-known/openid-configuration",
+    "o365": f"https://login.microsoftonline.com/{tenant_id}/v2.0/.well-known/openid-configuration",
+}
+
+started_at = time.time()
+
+_cached_report = None
+_cached_at = 0.0
+_inflight = None
+
+
+async def _timed(name, check, critical):
+    # /readyz no requiere autenticación: solo se exponen etiquetas fijas; el detalle va al log.
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout=health_check_timeout)
+        status, error = "ok", None
+    except asyncio.TimeoutError:
+        status, error = "down", "timeout"
+        logger.warning(f"Health check {name} timed out after {health_check_timeout}s")
+    except Exception as e:
+        status, error = "down", "unavailable"
+        logger.warning(f"Health check {name} failed: {e!r}")
+
+    result = {
+        "status": status,
+        "critical": critical,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    if error:
+        result["error"] = error
+    return name, result
+
+
+async def check_database():
+    await asyncio.to_thread(ping_database)
+
+
+async def check_replica():
+    await asyncio.to_thread(ping_database, replica_pool)
+
+
+async def check_queue():
+    await asyncio.to_thread(queue_client.get_queue_properties)
+
+
+def check_identity(session, url):
+    async def check():
+        async with session.get(url) as response:
+            if response.status >= 500:
+                raise Exception(f"HTTP {response.status}")
+    return check
+
+
+async def _run_checks():
+    timeout = aiohttp.ClientTimeout(total=health_check_timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        checks = [
+            _timed("database", check_database, critical=True),
+            _timed("queue", check_queue, critical=False),
+        ]
+        if replica_pool is not None:
+            # Si la réplica cae las lecturas van al primario, así que no es crítica.
+            checks.append(_timed("replica", check_replica, critical=False))
+        checks += [
+            _timed(name, check_identity(session, url), critical=False)
+            for name, url in identity_endpoints.items()
+        ]
+        results = dict(await asyncio.gather(*checks))
+
+    ready = all(r["status"] == "ok" for r in results.values() if r["critical"])
+    pool = primary_pool.stats()
+    pool_saturated = pool["saturation"] is not None and pool["saturation"] > health_pool_saturation_limit
+    if pool_saturated:
+        ready = False
+        logger.warning(f"Database pool saturated: {pool}")
+
+    degraded = any(r["status"] != "ok" for r in results.values())
+    return {
+        "status": "ready" if ready else "not_ready",
+        "degraded": degraded,
+        "pool_saturated": pool_saturated,
+        "checked_at": time.time(),
+        "dependencies": results,
+    }
+
+
+async def readiness():
+    """Estado de las dependencias, cacheado `health_cache_ttl` segundos.
+
+    Si llegan varios probes mientras se está comprobando, todos esperan la
+    misma comprobación en lugar de lanzar una cada uno.
+    """
+    global _cached_report, _cached_at, _inflight
+
+    if _cached_report is not None and time.monotonic() - _cached_at < health_cache_ttl:
+        return _cached_report
+
+    if _inflight is None or _inflight.done():
+        _inflight = asyncio.ensure_future(_run_checks())
+
+    try:
+        report = await asyncio.shield(_inflight)
+    except Exception as e:
+        logger.error(f"Error running readiness checks: {e}")
+        report = {"status": "not_ready", "error": "checks_failed"}
+
+    _cached_report = report
+    _cached_at = time.monotonic()
+    if report["status"] != "ready":
+        logger.warning(f"Readiness check failed: {report}")
+    return report
+
+
+async def liveness():
+    # Solo comprueba que el proceso y el event loop responden; no toca dependencias.
+    return {
+        "status": "alive",
+        "uptime_seconds": round(time.time() - started_at, 1),
+    }
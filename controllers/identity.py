@@ -0,0 +1,51 @@
+import logging
+
+from fastapi import HTTPException
+
+from utils.database import get_db_connection, rows_as_dicts
+from utils.security import create_jwt_token
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def fetch_user_by_email(email: str):
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT id_user, email, first_name, last_name, role, active
+            FROM [commette].[User]
+            WHERE email = %s
+            """,
+            (email,)
+        )
+        rows = rows_as_dicts(cursor)
+        return rows[0] if rows else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+async def issue_token_for_email(email: str):
+    """Emite nuestro JWT para una identidad ya verificada por un proveedor externo."""
+    try:
+        user = await fetch_user_by_email(email)
+    except Exception as e:
+        logger.error(f"Error fetching user {email}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    if user is None:
+        raise HTTPException(status_code=404, detail="Usuario no registrado")
+
+    return {
+        "message": "Usuario autenticado exitosamente",
+        "idToken": create_jwt_token(
+            user["id_user"],
+            user["first_name"],
+            user["last_name"],
+            user["email"],
+            user["role"],
+            user["active"]
+        )
+    }
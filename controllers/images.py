@@ -0,0 +1,277 @@
+import io
+import os
+import posixpath
+import uuid
+import asyncio
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from utils.database import get_db_connection
+from utils.search import product_index
+from utils.storage import get_blob_backend, storage_config, create_backend
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de la imagen y tamaño de cada bloque que se envía al almacenamiento.
+image_max_bytes = int(os.getenv("PRODUCT_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Cuerpo multipart máximo: la imagen más las cabeceras de las partes.
+upload_max_bytes = image_max_bytes + 64 * 1024
+image_block_bytes = int(os.getenv("PRODUCT_IMAGE_BLOCK_BYTES", str(4 * 1024 * 1024)))
+# Lados (px) de las miniaturas que se generan para cada imagen.
+thumbnail_sizes = [int(s) for s in os.getenv("THUMBNAIL_SIZES", "160,480").split(",") if s.strip()]
+# Procesos dedicados a las miniaturas y trabajos que pueden esperar turno.
+thumbnail_workers = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+thumbnail_queue_limit = int(os.getenv("THUMBNAIL_QUEUE_LIMIT", "16"))
+
+image_extensions = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+_executor = None
+_thumbnail_slots = None
+
+
+def generate_thumbnails(config: dict, source: str, sizes: list):
+    """Se ejecuta en el pool de procesos: lee el original y guarda una miniatura por tamaño."""
+    from PIL import Image
+
+    backend = create_backend(config)
+    original = Image.open(io.BytesIO(backend.read(source)))
+    # Para JPEG, draft decodifica directamente a menor resolución.
+    original.draft("RGB", (max(sizes), max(sizes)))
+    original = original.convert("RGB")
+
+    base = os.path.splitext(source)[0]
+    names = {}
+    for size in sizes:
+        thumbnail = original.copy()
+        thumbnail.thumbnail((size, size))
+        output = io.BytesIO()
+        thumbnail.save(output, format="JPEG", quality=85, optimize=True)
+        name = f"{base}_{size}.jpg"
+        backend.put(name, output.getvalue(), "image/jpeg")
+        names[size] = name
+    return names
+
+
+def _get_executor():
+    global _executor, _thumbnail_slots
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=thumbnail_workers)
+        _thumbnail_slots = asyncio.Semaphore(thumbnail_queue_limit)
+    return _executor
+
+
+def shutdown_thumbnail_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _create_thumbnails(source: str):
+    executor = _get_executor()
+    if _thumbnail_slots.locked():
+        logger.warning(f"Thumbnail queue full, skipping thumbnails for {source}")
+        return {}
+    async with _thumbnail_slots:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                executor, generate_thumbnails, storage_config(), source, thumbnail_sizes
+            )
+        except Exception as e:
+            logger.error(f"Error generating thumbnails for {source}: {e}")
+            return {}
+
+
+class _StreamingImageParser:
+    """Recorre el multipart por eventos; solo el campo `file` se envía al almacenamiento."""
+
+    def __init__(self, boundary: bytes, product_id: int):
+        self.product_id = product_id
+        self.events = []
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": lambda: self.events.append(("begin", b"")),
+            "on_header_field": lambda data, start, end: self.events.append(("field", data[start:end])),
+            "on_header_value": lambda data, start, end: self.events.append(("value", data[start:end])),
+            "on_header_end": lambda: self.events.append(("header_end", b"")),
+            "on_headers_finished": lambda: self.events.append(("headers", b"")),
+            "on_part_data": lambda data, start, end: self.events.append(("data", data[start:end])),
+            "on_part_end": lambda: self.events.append(("end", b"")),
+        })
+        self.headers = {}
+        self.field = b""
+        self.value = b""
+        self.in_file = False
+        self.upload = None
+        self.blob_name = None
+        self.content_type = None
+        self.buffer = bytearray()
+        self.size = 0
+        self.completed = False
+
+    async def _flush(self):
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            await asyncio.to_thread(self.upload.write, data)
+
+    async def _start_file(self):
+        disposition, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"file" or self.upload is not None:
+            return
+        content_type = self.headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+        if content_type not in image_extensions:
+            raise HTTPException(status_code=415, detail="Unsupported image type")
+        self.content_type = content_type
+        self.blob_name = f"products/{self.product_id}/{uuid.uuid4().hex}{image_extensions[content_type]}"
+        self.upload = await asyncio.to_thread(get_blob_backend().begin_upload, self.blob_name, content_type)
+        self.in_file = True
+
+    async def feed(self, chunk: bytes):
+        self.parser.write(chunk)
+        events, self.events = self.events, []
+        for kind, data in events:
+            if kind == "begin":
+                self.headers = {}
+                self.field = self.value = b""
+            elif kind == "field":
+                self.field += data
+            elif kind == "value":
+                self.value += data
+            elif kind == "header_end":
+                self.headers[self.field.lower()] = self.value
+                self.field = self.value = b""
+            elif kind == "headers":
+                await self._start_file()
+            elif kind == "data" and self.in_file:
+                self.size += len(data)
+                if self.size > image_max_bytes:
+                    raise HTTPException(status_code=413, detail="Image too large")
+                self.buffer += data
+                if len(self.buffer) >= image_block_bytes:
+                    await self._flush()
+            elif kind == "end" and self.in_file:
+                await self._flush()
+                await asyncio.to_thread(self.upload.commit)
+                self.in_file = False
+                self.completed = True
+
+    def finalize(self):
+        self.parser.finalize()
+
+    async def abort(self):
+        if self.upload is not None and not self.completed:
+            await asyncio.to_thread(self.upload.abort)
+
+
+async def _store_image_url(product_id: int, url: str):
+    """Guarda la URL de la imagen. Devuelve `(actualizado, URL anterior)`."""
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            UPDATE [commette].[Product]
+            SET product_image = %s, updated_at = SYSUTCDATETIME()
+            OUTPUT deleted.product_image
+            WHERE id_product = %d
+            """,
+            (url, product_id)
+        )
+        row = cursor.fetchone()
+        conn.commit()
+        return row is not None, row[0] if row else None
+    except Exception as e:
+        conn.discard()
+        logger.error(f"Error storing image for product {product_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+async def _check_product_owner(product_id: int, id_user: int, admin: bool):
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id_user FROM [commette].[Product] WHERE id_product = %d", (product_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if not admin and row[0] != id_user:
+        raise HTTPException(status_code=403, detail="Not allowed to change other sellers' products")
+
+
+def _delete_image_blobs(backend, product_id: int, url: str):
+    # Borra la imagen reemplazada y sus miniaturas solo si están bajo la carpeta del producto:
+    # `product_image` pudo venir del cliente y apuntar a la imagen de otro producto.
+    name = backend.name_from_url(url)
+    if name is None or posixpath.normpath(name) != name or not name.startswith(f"products/{product_id}/"):
+        return
+    base = os.path.splitext(name)[0]
+    for blob in [name] + [f"{base}_{size}.jpg" for size in thumbnail_sizes]:
+        try:
+            backend.delete(blob)
+        except Exception as e:
+            logger.warning(f"Could not delete replaced image blob {blob}: {e}")
+
+
+async def upload_product_image(request: Request, product_id: int, id_user: int, admin: bool = False):
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > upload_max_bytes:
+        raise HTTPException(status_code=413, detail="Image too large")
+
+    # Se comprueba antes de leer el cuerpo: solo el vendedor del producto o un administrador.
+    await _check_product_owner(product_id, id_user, admin)
+
+    parser = _StreamingImageParser(params[b"boundary"], product_id)
+    try:
+        async for chunk in request.stream():
+            await parser.feed(chunk)
+        parser.finalize()
+    except Exception:
+        await parser.abort()
+        raise
+
+    if not parser.completed:
+        raise HTTPException(status_code=400, detail="Multipart field 'file' not found")
+
+    backend = get_blob_backend()
+    url = backend.url(parser.blob_name)
+    updated, previous_url = await _store_image_url(product_id, url)
+    if not updated:
+        await asyncio.to_thread(backend.delete, parser.blob_name)
+        raise HTTPException(status_code=404, detail="Product not found")
+    if previous_url and previous_url != url:
+        await asyncio.to_thread(_delete_image_blobs, backend, product_id, previous_url)
+
+    if product_index.ready:
+        product_index.upsert({"id_product": product_id, "product_image": url})
+
+    thumbnails = await _create_thumbnails(parser.blob_name)
+    return {
+        "id_product": product_id,
+        "product_image": url,
+        "size": parser.size,
+        "thumbnails": {str(size): backend.url(name) for size, name in thumbnails.items()},
+    }
@@ -16,8 +16,15 @@ from msal import ConfidentialClientApplication
 # Importa la función para codificar parámetros de consulta de URL.
 from urllib.parse import urlencode  
 
-# Importa el módulo para realizar solicitudes HTTP.
-import requests  
+# Importa el módulo de logging y PyJWT para los errores de validación del id_token.
+import logging  
+import jwt  
+
+# Importa el proveedor OIDC con discovery y JWKS cacheados y el POST asíncrono.
+from utils.jwks import OpenIDProvider, post_form  
+
+# Importa la función que emite nuestro JWT para un email ya verificado.
+from controllers.identity import issue_token_for_email  
 
 # Importa el módulo para generar secretos y tokens seguros.
 import secrets  
@@ -46,12 +53,31 @@ tenant_id = os.getenv("TENANT_ID")
 # Obtiene la URI de redirección desde las variables de entorno.
 redirect_uri = os.getenv("REDIRECT_URI")  
 
+# Autoridades de Entra ID que aceptan cuentas de cualquier tenant.
+multi_tenant_authorities = {"common", "organizations", "consumers"}  
+
+# Tenants (`tid`) cuyos usuarios pueden iniciar sesión; por defecto, solo el tenant configurado.
+allowed_tenants = {
+    tid.strip()
+    for tid in os.getenv("O365_ALLOWED_TENANTS", "" if tenant_id in multi_tenant_authorities else tenant_id or "").split(",")
+    if tid.strip()
+}  
+
 # Define la URL para solicitar la autorización.
 authorization_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/authorize"  
 
 # Define la URL para solicitar el token de acceso.
 token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"  
 
+# Define la URL del documento de discovery OpenID Connect del tenant.
+discovery_url = f"https://login.microsoftonline.com/{tenant_id}/v2.0/.well-known/openid-configuration"  
+
+# Valida el id_token localmente con el JWKS cacheado (se refresca en segundo plano).
+o365_provider = OpenIDProvider(discovery_url, client_id)  
+
+# Configura el logger del módulo.
+logger = logging.getLogger(__name__)  
+
 # Configura el esquema de autorización OAuth2 con las URLs correspondientes.
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=authorization_url,  # URL para la autorización.
@@ -93,7 +119,7 @@ async def login_o365(request: Request):
         "response_type": "code",  # Tipo de respuesta esperado: código de autorización.
         "redirect_uri": redirect_uri,  # URI a la que se redirige después de la autorización.
         "response_mode": "query",  # Modo de respuesta: parámetros en la URL.
-        "scope": "User.Read",  # Alcance de la solicitud: leer la información del usuario.
+        "scope": "openid email profile User.Read",  # Alcance: id_token con email y lectura del usuario.
         "code_challenge": pkce_challenge,  # Código de desafío PKCE.
         "code_challenge_method": "S256"  # Método de hash usado para el PKCE challenge.
     }
@@ -134,18 +160,40 @@ async def auth_callback_o365(request: Request):
         "code_verifier": pkce_verifier  # PKCE verifier para el intercambio.
     }
 
-    # Realiza una solicitud POST para obtener el token.
-    token_response = requests.post(token_url, data=token_data)  
-    # Convierte la respuesta a formato JSON.
-    token_response_data = token_response.json()  
+    # Realiza una solicitud POST asíncrona para obtener el token.
+    _, token_response_data = await post_form(token_url, token_data)  
 
-    # Si el token de acceso está presente en los datos de respuesta:
-    if "access_token" in token_response_data:  
-        # Devuelve el token de acceso en formato JSON.
-        return JSONResponse(content={"access_token": token_response_data["access_token"]})  
-    else:  
+    # Si el id_token no está presente en los datos de respuesta:
+    if "id_token" not in token_response_data:  
         # Devuelve un error en formato JSON si el token no está presente.
         return JSONResponse(content={
             "error": token_response_data.get("error"),  # Mensaje de error.
             "error_description": token_response_data.get("error_description")  # Descripción del error.
         }, status_code=400)  # Devuelve un estado HTTP 400 en caso de error.
+
+    # El verifier es de un solo uso.
+    pkce_verifier_store.pop(request.client.host, None)  
+
+    # Valida firma, audiencia, emisor y fechas del id_token sin llamar a Microsoft Graph.
+    try:
+        claims = await o365_provider.validate_id_token(token_response_data["id_token"])  
+    except jwt.PyJWTError as e:
+        logger.info(f"Rejected O365 id_token: {e}")  
+        raise HTTPException(status_code=401, detail="Invalid id_token")  
+    except Exception as e:
+        logger.error(f"Error loading O365 signing keys: {e}")  
+        raise HTTPException(status_code=503, detail="O365 signing keys unavailable")  
+
+    # `email` y `preferred_username` los puede cambiar el administrador de cualquier tenant:
+    # solo se acepta `email` de un tenant permitido y con dominio verificado (claim opcional `xms_edov`).
+    if claims.get("tid") not in allowed_tenants:
+        logger.info(f"Rejected O365 login from tenant {claims.get('tid')}")  
+        raise HTTPException(status_code=403, detail="O365 tenant not allowed")  
+    email = claims.get("email")  
+    if not email or claims.get("xms_edov") not in (True, 1, "1", "true", "True"):
+        raise HTTPException(status_code=403, detail="O365 account has no verified email")  
+
+    # Emite nuestro JWT para el usuario y conserva el access token para Microsoft Graph.
+    result = await issue_token_for_email(email)  
+    result["access_token"] = token_response_data.get("access_token")  
+    return JSONResponse(content=result)  
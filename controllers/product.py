@@ -1,19 +1,28 @@
+import io
+import csv
 import json
+import asyncio
 import logging
 from fastapi import HTTPException
-from utils.database import fetch_query_as_json
+from fastapi.responses import StreamingResponse
+from utils.database import fetch_query_as_json, get_db_connection, iter_query_batches, decimal_to_float, rows_as_dicts
+from utils.search import product_index
+from utils.seller_stats import seller_stats
+from utils.reference_cache import reference_cache
+from utils.events import product_events, stock_payload
+from controllers.reservations import set_known_stock, stock_change
 from models.Product import Product, updateProduct
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def execute_query(query: str):
+async def execute_query(query: str, read_only: bool = False):
     try:
         logger.info(f"EXECUTING QUERY: {query}")
         result = {}
         
-        result_json = await fetch_query_as_json(query, is_procedure=True)
+        result_json = await fetch_query_as_json(query, is_procedure=True, read_only=read_only)
         result = json.loads(result_json)[0]
         logger.info(f"QUERY RESULT: {result_json}")
         
@@ -37,11 +46,13 @@ async def fetch_categories():
         FROM [commette].[Category]
         ORDER BY id_category
     """
-    try:
+    async def load():
         logger.info(f"QUERY FETCH CATEGORIES")
-        result_json = await fetch_query_as_json(query)
-        result_dict = json.loads(result_json)
-        return result_dict
+        return json.loads(await fetch_query_as_json(query, read_only=True))
+
+    try:
+        # Cambian muy poco: se sirven de la caché de referencia y se recargan en segundo plano.
+        return await reference_cache.get("categories", load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -54,11 +65,12 @@ async def fetch_brands():
         FROM [commette].[Brand]
         ORDER BY id_brand
     """
-    try:
+    async def load():
         logger.info(f"QUERY FETCH BRANDS")
-        result_json = await fetch_query_as_json(query)
-        result_dict = json.loads(result_json)
-        return result_dict
+        return json.loads(await fetch_query_as_json(query, read_only=True))
+
+    try:
+        return await reference_cache.get("brands", load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -80,6 +92,9 @@ async def create_product(product: Product):
         logger.info(f"RESULT CREATE PRODUCT: {result_dict}")
         if result_dict is None:
             raise HTTPException(status_code=500, detail="No result returned from create product")
+        product_id = await index_created_product(result_dict)
+        update_seller_stats(product_id, product.id_seller, product.stock, product.price, product.product_name)
+        publish_product_event("created", product_id, product.model_dump())
         return result_dict
     except Exception as e:
         logger.error(f"Error creating product: {e}")
@@ -89,7 +104,7 @@ async def fetch_product_info():
     query = "EXEC commette.product_info"
     try:
         logger.info(f"QUERY FETCH PRODUCT INFO: {query}")
-        result_json = await fetch_query_as_json(query, is_procedure=False)
+        result_json = await fetch_query_as_json(query, is_procedure=False, read_only=True)
         
         if result_json is None:
             raise HTTPException(status_code=500, detail="No result returned from fetch product info")
@@ -101,24 +116,345 @@ async def fetch_product_info():
         logger.error(f"Error fetching product info: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-async def update_product(product: updateProduct):
-    query = f"""
-        EXEC commette.update_product
-            @id_product = {product.id_product},
-            @id_brand = {product.id_brand},
-            @id_category = {product.id_category},
-            @product_name = '{product.product_name}',
-            @product_description = '{product.product_description or ''}',
-            @price = {product.price},
-            @stock = {product.stock}
+# Control de concurrencia optimista: el rowversion de cada producto se expone como ETag
+# y las escrituras con If-Match solo se aplican si la versión no ha cambiado.
+def format_etag(version):
+    return f'"{version}"' if version is not None else None
+
+def parse_if_match(header: str):
+    if header is None:
+        return None
+    header = header.strip()
+    if header == "*":
+        return "*"
+    versions = set()
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        try:
+            versions.add(int(tag.strip('"')))
+        except ValueError:
+            continue
+    return versions
+
+def etag_matches(header: str, version) -> bool:
+    # Para If-None-Match la comparación es débil (RFC 9110): W/"7" coincide con "7".
+    versions = parse_if_match(header)
+    if versions is None or version is None:
+        return False
+    return versions == "*" or version in versions
+
+def _lock_product_version(cursor, product_id: int, if_match: str = None):
+    # UPDLOCK + HOLDLOCK mantiene la fila bloqueada hasta el commit, así la
+    # comparación de versión y la escritura son atómicas.
+    cursor.execute(
+        "SELECT CAST(row_version AS BIGINT) FROM [commette].[Product] WITH (UPDLOCK, HOLDLOCK) WHERE id_product = %d",
+        (product_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    expected = parse_if_match(if_match)
+    if expected not in (None, "*") and row[0] not in expected:
+        raise HTTPException(status_code=412, detail="Product was modified by another request")
+    return row[0]
+
+def _touch_product(cursor, product_id: int):
+    # Fuerza un nuevo rowversion aunque el procedimiento solo haya cambiado el inventario.
+    cursor.execute(
+        """
+        UPDATE [commette].[Product]
+        SET updated_at = SYSUTCDATETIME()
+        OUTPUT CAST(inserted.row_version AS BIGINT)
+        WHERE id_product = %d
+        """,
+        (product_id,)
+    )
+    return cursor.fetchone()[0]
+
+def _procedure_result(cursor):
+    result = rows_as_dicts(cursor)
+    while cursor.nextset():
+        rows_as_dicts(cursor)
+    return result or [{"status": 200, "message": "Procedure executed successfully"}]
+
+async def fetch_product_by_id(product_id: int):
+    conn = await get_db_connection(read_only=True)
+    cursor = conn.cursor()
+    try:
+        # Versión y datos en un solo viaje a la base de datos.
+        cursor.execute(
+            """
+            SELECT CAST(row_version AS BIGINT) FROM [commette].[Product] WHERE id_product = %d;
+            EXEC commette.get_product_by_id @ProductID = %d;
+            """,
+            (product_id, product_id)
+        )
+        row = cursor.fetchone()
+        version = row[0] if row else None
+        result = []
+        if cursor.nextset():
+            result = rows_as_dicts(cursor)
+        return result, version
+    except Exception as e:
+        conn.discard()
+        logger.error(f"Error fetching product {product_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        cursor.close()
+        conn.close()
+
+async def update_product(product: updateProduct, if_match: str = None):
+    # Con las reservas del producto bloqueadas, el nuevo stock debe cubrir lo retenido en memoria.
+    async with stock_change(product.id_product) as held:
+        if product.stock < held:
+            raise HTTPException(status_code=409, detail=f"Stock cannot be lower than the {held} reserved units")
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            logger.info(f"QUERY UPDATE PRODUCT: {product.id_product}")
+            _lock_product_version(cursor, product.id_product, if_match)
+            cursor.execute(
+                """
+                EXEC commette.update_product
+                    @id_product = %d,
+                    @id_brand = %d,
+                    @id_category = %d,
+                    @product_name = %s,
+                    @product_description = %s,
+                    @price = %s,
+                    @stock = %d
+                """,
+                (
+                    product.id_product,
+                    product.id_brand,
+                    product.id_category,
+                    product.product_name,
+                    product.product_description or '',
+                    product.price,
+                    product.stock,
+                )
+            )
+            result_dict = _procedure_result(cursor)
+            version = _touch_product(cursor, product.id_product)
+            conn.commit()
+            logger.info(f"RESULT UPDATE PRODUCT: {result_dict}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.discard()
+            logger.error(f"Error updating product: {e}")
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        finally:
+            cursor.close()
+            conn.close()
+
+        set_known_stock(product.id_product, product.stock)
+
+    await refresh_indexed_product(product.id_product)
+    update_seller_stats(product.id_product, stock=product.stock, price=product.price, name=product.product_name)
+    publish_product_event("updated", product.id_product, product.model_dump())
+    return result_dict, version
+
+async def adjust_product_stock(product_id: int, delta: int, if_match: str = None):
+    """Suma `delta` al stock de forma atómica.
+
+    Nunca deja el stock por debajo de lo reservado o confirmado en memoria y aún
+    no descontado en SQL Server (ni por debajo de cero).
     """
+    async with stock_change(product_id) as held:
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if if_match is not None:
+                _lock_product_version(cursor, product_id, if_match)
+            cursor.execute(
+                """
+                UPDATE [commette].[Inventory]
+                SET stock = stock + %d
+                OUTPUT inserted.stock
+                WHERE id_product = %d AND stock + %d >= %d
+                """,
+                (delta, product_id, delta, held)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("SELECT stock FROM [commette].[Inventory] WHERE id_product = %d", (product_id,))
+                if cursor.fetchone() is None:
+                    raise HTTPException(status_code=404, detail="Product not found")
+                raise HTTPException(status_code=409, detail="Insufficient stock")
+            stock = row[0]
+            version = _touch_product(cursor, product_id)
+            conn.commit()
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.discard()
+            logger.error(f"Error adjusting stock for product {product_id}: {e}")
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        finally:
+            cursor.close()
+            conn.close()
+
+        set_known_stock(product_id, stock)
+
+    if product_index.ready:
+        product_index.upsert({"id_product": product_id, "stock": stock})
+    update_seller_stats(product_id, stock=stock)
+    product_events.publish("stock", product_id, stock_payload(product_id, stock, product_index.docs.get(product_id)))
+    return {"id_product": product_id, "stock": stock}, version
+
+async def delete_product(product_id: int, if_match: str = None):
+    conn = await get_db_connection()
+    cursor = conn.cursor()
     try:
-        logger.info(f"QUERY UPDATE PRODUCT: {query}")
-        result_dict = await execute_query(query)
-        logger.info(f"RESULT UPDATE PRODUCT: {result_dict}")
-        if result_dict is None:
-            raise HTTPException(status_code=500, detail="No result returned from update product")
-        return result_dict
+        _lock_product_version(cursor, product_id, if_match)
+        cursor.execute("EXEC commette.delete_product_and_inventory @id_product = %d", (product_id,))
+        result = _procedure_result(cursor)
+        conn.commit()
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error updating product: {e}")
+        conn.discard()
+        logger.error(f"Error deleting product {product_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        cursor.close()
+        conn.close()
+
+    # Los datos previos del índice permiten filtrar el evento por vendedor y categoría.
+    last_known = product_index.docs.get(product_id, {})
+    product_index.remove(product_id)
+    seller_stats.remove(product_id)
+    publish_product_event("deleted", product_id, {**last_known, "id_product": product_id})
+    return result
+
+
+# Notificaciones en vivo (GET /products/stream). Se publica después del commit.
+def publish_product_event(event_type: str, product_id, fallback: dict = None):
+    data = product_index.docs.get(product_id) if event_type != "deleted" else None
+    if data is None:
+        data = dict(fallback or {})
+        if product_id is not None:
+            data["id_product"] = product_id
+    product_events.publish(event_type, product_id, data)
+
+
+# Búsqueda de productos sobre el índice en memoria (utils/search.py).
+_index_rebuild_task = None
+
+async def build_search_index():
+    # Con la misma lectura de product_info se recalculan los agregados por vendedor.
+    try:
+        rows = await fetch_product_info()
+        product_index.rebuild(rows)
+        seller_stats.rebuild(rows)
+    except Exception as e:
+        logger.error(f"Error building search index: {e}")
+
+def schedule_search_index_rebuild():
+    # Evita reconstrucciones simultáneas: si ya hay una en curso se reutiliza.
+    global _index_rebuild_task
+    if _index_rebuild_task is None or _index_rebuild_task.done():
+        _index_rebuild_task = asyncio.create_task(build_search_index())
+    return _index_rebuild_task
+
+async def refresh_indexed_product(product_id: int):
+    if not product_index.ready:
+        return
+    try:
+        query = f"EXEC commette.get_product_by_id @ProductID = {product_id}"
+        rows = json.loads(await fetch_query_as_json(query, read_only=True))
+        if rows:
+            product_index.upsert(rows[0])
+        else:
+            product_index.remove(product_id)
+    except Exception as e:
+        logger.error(f"Error refreshing product {product_id} in search index: {e}")
+        schedule_search_index_rebuild()
+
+async def index_created_product(result):
+    # create_product no siempre devuelve el id; en ese caso se reconstruye el índice en segundo plano.
+    rows = result if isinstance(result, list) else [result]
+    product_id = next((row.get("id_product") for row in rows if isinstance(row, dict) and row.get("id_product")), None)
+    if not product_index.ready:
+        return product_id
+    if product_id is None:
+        schedule_search_index_rebuild()
+    else:
+        await refresh_indexed_product(product_id)
+    return product_id
+
+def update_seller_stats(product_id, seller=None, stock=None, price=None, name=None):
+    if not seller_stats.ready:
+        return
+    # Producto sin id o desconocido: se recalcula todo en segundo plano.
+    if product_id is None or not seller_stats.upsert(product_id, seller, stock, price, name):
+        schedule_search_index_rebuild()
+
+async def search_products(q: str = None, category: str = None, brand: str = None,
+                          min_price: float = None, max_price: float = None,
+                          page: int = 1, page_size: int = 20):
+    if not product_index.ready:
+        await schedule_search_index_rebuild()
+    if not product_index.ready:
+        raise HTTPException(status_code=503, detail="Search index not available")
+    return product_index.search(
+        q=q,
+        category=category,
+        brand=brand,
+        min_price=min_price,
+        max_price=max_price,
+        page=page,
+        page_size=page_size,
+    )
+
+
+# Exportación del catálogo en streaming (CSV / NDJSON) directamente desde el cursor.
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _iter_csv(query: str):
+    header_sent = False
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for columns, rows in iter_query_batches(query):
+        if not header_sent:
+            writer.writerow(columns)
+            header_sent = True
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+
+def _iter_ndjson(query: str):
+    for columns, rows in iter_query_batches(query):
+        lines = [
+            json.dumps(decimal_to_float(dict(zip(columns, row))), default=str)
+            for row in rows
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def export_products(format: str, user_id: int = None):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+
+    if user_id is None:
+        query = "EXEC commette.product_info"
+        filename = f"products.{format}"
+    else:
+        query = f"EXEC commette.get_products_by_user_id @UserID = {int(user_id)}"
+        filename = f"products_user_{int(user_id)}.{format}"
+
+    rows = _iter_csv(query) if format == "csv" else _iter_ndjson(query)
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-cache",
+        },
+    )
@@ -0,0 +1,365 @@
+import os
+import asyncio
+import logging
+import weakref
+
+from contextlib import asynccontextmanager
+
+import jwt
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from utils.database import get_db_connection, open_db_connection
+from utils.search import product_index
+from utils.seller_stats import seller_stats
+from utils.events import product_events, stock_payload
+from utils.security import SECRET_KEY
+from utils.reservations import ReservationEngine, InsufficientStock, ReservationNotFound
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tiempo que una reserva retiene el stock antes de liberarse sola.
+reservation_ttl_seconds = float(os.getenv("RESERVATION_TTL_SECONDS", "600"))
+# Cada cuánto se liberan las reservas caducadas.
+reservation_sweep_seconds = float(os.getenv("RESERVATION_SWEEP_SECONDS", "2"))
+# Segundos sin movimiento tras los que se vuelve a leer el stock de SQL Server.
+reservation_counter_idle_seconds = float(os.getenv("RESERVATION_COUNTER_IDLE_SECONDS", "60"))
+# Confirmaciones que se escriben juntas en una transacción.
+reservation_confirm_batch = int(os.getenv("RESERVATION_CONFIRM_BATCH", "200"))
+# Tiempo que se conserva cada confirmación o liberación en ReservationLog (mayor que el TTL).
+reservation_log_retention_seconds = int(os.getenv("RESERVATION_LOG_RETENTION_SECONDS", "86400"))
+
+engine = None
+_loop_task = None
+# Un lock por producto mientras se escribe su stock; se libera solo cuando nadie lo usa.
+_stock_locks = weakref.WeakValueDictionary()
+# Confirmaciones pendientes de escribir, la tarea que las escribe y los futuros por reserva.
+_confirm_queue = []
+_confirm_writer = None
+_confirming = {}
+
+
+def _reservation_token(reservation: dict) -> str:
+    # El id público lleva firmados producto, cantidad, usuario y caducidad:
+    # cualquier instancia puede confirmar o liberar la reserva.
+    return jwt.encode(
+        {
+            "kind": "reservation",
+            "rid": reservation["id"],
+            "pid": reservation["id_product"],
+            "qty": reservation["quantity"],
+            "uid": reservation["id_user"],
+            "exp": int(reservation["expires_at"]),
+        },
+        SECRET_KEY,
+        algorithm="HS256",
+    )
+
+
+def _read_token(token: str, id_user: int, admin: bool):
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"], options={"require": ["exp"]})
+    except jwt.PyJWTError:
+        claims = None
+    if claims is None or claims.get("kind") != "reservation":
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+    if not admin and claims["uid"] != id_user:
+        raise HTTPException(status_code=403, detail="Reservation belongs to another user")
+    return {
+        "id": claims["rid"],
+        "id_product": claims["pid"],
+        "quantity": claims["qty"],
+        "id_user": claims["uid"],
+        "expires_at": claims["exp"],
+    }
+
+
+def _public(reservation: dict, token: str, status: str):
+    return {
+        "id": token,
+        "id_product": reservation["id_product"],
+        "quantity": reservation["quantity"],
+        "expires_at": reservation["expires_at"],
+        "status": status,
+    }
+
+
+def _write_confirmations(reservations: list):
+    """Descuenta el stock de cada reserva en una sola transacción.
+
+    Cada reserva se aplica solo si queda stock y no está ya en ReservationLog.
+    Devuelve `{reservation_id: (resultado, stock actual)}` con resultado
+    'confirmed', 'duplicate' (confirmada antes), 'released', 'insufficient'
+    o 'missing'.
+    """
+    conn = open_db_connection()
+    cursor = conn.cursor()
+    try:
+        values = ", ".join(["(%d, %s, %d, %d)"] * len(reservations))
+        params = []
+        for seq, reservation in enumerate(reservations):
+            params += [seq, reservation["id"], reservation["id_product"], reservation["quantity"]]
+        params.append(reservation_log_retention_seconds)
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+            SET XACT_ABORT ON;
+            DECLARE @items TABLE (seq INT PRIMARY KEY, reservation_id CHAR(32), id_product INT, quantity INT);
+            DECLARE @results TABLE (reservation_id CHAR(32) PRIMARY KEY, result VARCHAR(12));
+            DECLARE @seq INT = 0, @count INT, @rid CHAR(32), @pid INT, @qty INT, @status VARCHAR(10);
+            INSERT INTO @items (seq, reservation_id, id_product, quantity) VALUES {values};
+            SELECT @count = COUNT(*) FROM @items;
+
+            BEGIN TRANSACTION;
+            WHILE @seq < @count
+            BEGIN
+                SELECT @rid = reservation_id, @pid = id_product, @qty = quantity FROM @items WHERE seq = @seq;
+                SET @status = NULL;
+                SELECT @status = status FROM [commette].[ReservationLog] WITH (UPDLOCK, HOLDLOCK)
+                WHERE reservation_id = @rid;
+                IF @status IS NOT NULL
+                    INSERT INTO @results VALUES (@rid, CASE WHEN @status = 'confirmed' THEN 'duplicate' ELSE 'released' END);
+                ELSE
+                BEGIN
+                    UPDATE [commette].[Inventory] SET stock = stock - @qty
+                    WHERE id_product = @pid AND stock >= @qty;
+                    IF @@ROWCOUNT = 1
+                    BEGIN
+                        INSERT INTO [commette].[ReservationLog] (reservation_id, status, id_product, quantity)
+                        VALUES (@rid, 'confirmed', @pid, @qty);
+                        INSERT INTO @results VALUES (@rid, 'confirmed');
+                    END
+                    ELSE
+                        INSERT INTO @results VALUES (@rid, CASE
+                            WHEN EXISTS (SELECT 1 FROM [commette].[Inventory] WHERE id_product = @pid) THEN 'insufficient'
+                            ELSE 'missing' END);
+                END
+                SET @seq += 1;
+            END
+
+            UPDATE [commette].[Product] SET updated_at = SYSUTCDATETIME()
+            WHERE id_product IN (
+                SELECT i.id_product FROM @items i
+                JOIN @results r ON r.reservation_id = i.reservation_id
+                WHERE r.result = 'confirmed'
+            );
+            DELETE TOP (100) FROM [commette].[ReservationLog]
+            WHERE created_at < DATEADD(SECOND, -%d, SYSUTCDATETIME());
+            COMMIT;
+
+            SELECT r.reservation_id, r.result, inv.stock
+            FROM @results r
+            JOIN @items i ON i.reservation_id = r.reservation_id
+            LEFT JOIN [commette].[Inventory] inv ON inv.id_product = i.id_product;
+            """,
+            tuple(params)
+        )
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    except Exception:
+        conn.discard()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _write_release(reservation: dict):
+    """Registra la liberación. Devuelve 'released' o 'confirmed' si ya se había confirmado."""
+    conn = open_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SET NOCOUNT ON;
+            SET XACT_ABORT ON;
+            BEGIN TRANSACTION;
+            DECLARE @status VARCHAR(10);
+            SELECT @status = status FROM [commette].[ReservationLog] WITH (UPDLOCK, HOLDLOCK)
+            WHERE reservation_id = %s;
+            IF @status IS NULL
+                INSERT INTO [commette].[ReservationLog] (reservation_id, status, id_product, quantity)
+                VALUES (%s, 'released', %d, %d);
+            COMMIT;
+            SELECT ISNULL(@status, 'released');
+            """,
+            (reservation["id"], reservation["id"], reservation["id_product"], reservation["quantity"])
+        )
+        return cursor.fetchone()[0]
+    except Exception:
+        conn.discard()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _publish_stock(product_id: int, stock: int):
+    if product_index.ready:
+        product_index.upsert({"id_product": product_id, "stock": stock})
+    if seller_stats.ready:
+        seller_stats.set_stock(product_id, stock)
+    product_events.publish("stock", product_id, stock_payload(product_id, stock, product_index.docs.get(product_id)))
+
+
+async def _write_confirm_queue():
+    # Commit en grupo: lo que llega mientras se escribe un lote va en el siguiente.
+    while _confirm_queue:
+        batch = _confirm_queue[:reservation_confirm_batch]
+        del _confirm_queue[:len(batch)]
+        try:
+            results = await asyncio.to_thread(_write_confirmations, [reservation for reservation, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Error confirming {len(batch)} reservations: {e}")
+            results = None
+
+        stocks = {}
+        for reservation, held, future in batch:
+            _confirming.pop(reservation["id"], None)
+            result, stock = results.get(reservation["id"], ("missing", None)) if results is not None else ("error", None)
+            engine.confirm_finished(reservation, held, result == "confirmed", stock)
+            if result == "confirmed":
+                stocks[reservation["id_product"]] = stock
+            if not future.done():
+                future.set_result(result)
+        for product_id, stock in stocks.items():
+            _publish_stock(product_id, stock)
+
+
+def _submit_confirm(reservation: dict, held: bool):
+    global _confirm_writer
+    future = asyncio.get_running_loop().create_future()
+    _confirming[reservation["id"]] = future
+    _confirm_queue.append((reservation, held, future))
+    if _confirm_writer is None or _confirm_writer.done():
+        _confirm_writer = asyncio.create_task(_write_confirm_queue())
+    return future
+
+
+async def _reservation_loop():
+    while True:
+        await asyncio.sleep(reservation_sweep_seconds)
+        try:
+            engine.expire()
+            engine.evict_idle(reservation_counter_idle_seconds)
+        except Exception as e:
+            logger.error(f"Error in reservation loop: {e}")
+
+
+async def start_reservations():
+    """Arranca el motor. No hay nada que recuperar tras una caída: las reservas
+    perdidas solo retenían stock en memoria y cada confirmación se escribe en
+    SQL Server antes de responder, de forma idempotente (ReservationLog)."""
+    global engine, _loop_task
+    engine = ReservationEngine(reservation_ttl_seconds)
+    _loop_task = asyncio.create_task(_reservation_loop())
+
+
+async def stop_reservations():
+    global _loop_task
+    if _loop_task is not None:
+        _loop_task.cancel()
+        _loop_task = None
+    if _confirm_writer is not None and not _confirm_writer.done():
+        await _confirm_writer
+
+
+def set_known_stock(product_id: int, stock: int):
+    if engine is not None:
+        engine.set_stock(product_id, stock)
+
+
+@asynccontextmanager
+async def stock_change(product_id: int):
+    """Bloquea nuevas reservas del producto mientras se escribe su stock en SQL Server.
+
+    Devuelve las unidades retenidas en memoria (reservadas o confirmándose):
+    el stock que quede en SQL no puede ser menor. Quien escribe debe llamar a
+    `set_known_stock` antes de salir del bloque.
+    """
+    lock = _stock_locks.get(product_id)
+    if lock is None:
+        lock = _stock_locks[product_id] = asyncio.Lock()
+    async with lock:
+        yield engine.held(product_id) if engine is not None else 0
+
+
+async def _ensure_loaded(product_id: int):
+    if engine.is_loaded(product_id):
+        return
+    conn = await get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT stock FROM [commette].[Inventory] WHERE id_product = %d", (product_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    engine.load(product_id, row[0])
+
+
+def _require_engine():
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Reservations not available")
+
+
+async def reserve_stock(product_id: int, quantity: int, id_user: int):
+    _require_engine()
+    async with stock_change(product_id):
+        await _ensure_loaded(product_id)
+        try:
+            reservation = engine.reserve(product_id, quantity, id_user)
+        except InsufficientStock:
+            raise HTTPException(status_code=409, detail="Insufficient stock")
+    return _public(reservation, _reservation_token(reservation), "reserved")
+
+
+async def confirm_reservation(reservation_id: str, id_user: int, admin: bool = False):
+    """Confirma la reserva; responde solo cuando SQL Server ya descontó el stock."""
+    _require_engine()
+    reservation = _read_token(reservation_id, id_user, admin)
+
+    future = _confirming.get(reservation["id"])
+    if future is None:
+        # Si la reserva es de esta instancia sus unidades siguen retenidas hasta escribirla;
+        # si no (otra instancia, reinicio), SQL Server decide con el stock que quede.
+        held = reservation["id"] in engine.reservations
+        if held:
+            try:
+                engine.begin_confirm(reservation["id"])
+            except InsufficientStock:
+                raise HTTPException(status_code=409, detail="Insufficient stock, reservation released")
+        future = _submit_confirm(reservation, held)
+
+    result = await asyncio.shield(future)
+    if result in ("confirmed", "duplicate"):
+        return _public(reservation, reservation_id, "confirmed")
+    if result == "released":
+        raise HTTPException(status_code=409, detail="Reservation was released")
+    if result == "insufficient":
+        raise HTTPException(status_code=409, detail="Insufficient stock, reservation released")
+    if result == "missing":
+        raise HTTPException(status_code=404, detail="Product not found")
+    raise HTTPException(status_code=503, detail="Could not confirm the reservation, retry")
+
+
+async def release_reservation(reservation_id: str, id_user: int, admin: bool = False):
+    _require_engine()
+    reservation = _read_token(reservation_id, id_user, admin)
+    try:
+        status = await asyncio.to_thread(_write_release, reservation)
+    except Exception as e:
+        logger.error(f"Error releasing reservation {reservation['id']}: {e}")
+        raise HTTPException(status_code=503, detail="Could not release the reservation, retry")
+    if status == "confirmed":
+        raise HTTPException(status_code=409, detail="Reservation was already confirmed")
+    try:
+        engine.release(reservation["id"])
+    except ReservationNotFound:
+        # Caducada, en curso de confirmación o de otra instancia (allí caduca sola).
+        pass
+    return _public(reservation, reservation_id, "released")
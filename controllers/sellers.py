@@ -0,0 +1,49 @@
+import os
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from utils.seller_stats import seller_stats
+from controllers.product import build_search_index, schedule_search_index_rebuild
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se recalculan desde product_info los agregados (y el índice de búsqueda). 0 = nunca.
+seller_stats_reconcile_seconds = float(os.getenv("SELLER_STATS_RECONCILE_SECONDS", "900"))
+
+_reconcile_task = None
+
+
+async def fetch_seller_stats(seller_id: int):
+    if not seller_stats.ready:
+        await schedule_search_index_rebuild()
+    if not seller_stats.ready:
+        raise HTTPException(status_code=503, detail="Seller stats not available")
+    return seller_stats.stats(seller_id)
+
+
+async def _reconcile_loop():
+    while True:
+        await asyncio.sleep(seller_stats_reconcile_seconds)
+        try:
+            await build_search_index()
+        except Exception as e:
+            logger.error(f"Error reconciling seller stats: {e}")
+
+
+def start_seller_stats_reconciliation():
+    global _reconcile_task
+    if seller_stats_reconcile_seconds > 0 and _reconcile_task is None:
+        _reconcile_task = asyncio.create_task(_reconcile_loop())
+
+
+def stop_seller_stats_reconciliation():
+    global _reconcile_task
+    if _reconcile_task is not None:
+        _reconcile_task.cancel()
+        _reconcile_task = None
@@ -0,0 +1,161 @@
+import os
+import time
+import random
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+from utils.snapshot import write_snapshot, read_snapshot, SnapshotError
+from utils.search import product_index
+from utils.seller_stats import seller_stats
+from utils.reference_cache import reference_cache
+from controllers.product import schedule_search_index_rebuild, fetch_categories, fetch_brands
+from controllers.changes import fetch_product_changes
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+snapshot_path = os.getenv("CACHE_SNAPSHOT_PATH", "data/cache-snapshot.bin")
+# Cada cuánto se escribe la instantánea (0 = nunca) y antigüedad máxima para usarla al arrancar.
+snapshot_interval_seconds = float(os.getenv("CACHE_SNAPSHOT_INTERVAL_SECONDS", "300"))
+snapshot_max_age_seconds = float(os.getenv("CACHE_SNAPSHOT_MAX_AGE_SECONDS", "86400"))
+# Instantáneas sin token del feed de cambios: ventana máxima de espera aleatoria antes de la reconstrucción completa.
+snapshot_reconcile_jitter_seconds = float(os.getenv("CACHE_SNAPSHOT_RECONCILE_JITTER_SECONDS", "300"))
+
+_snapshot_task = None
+_reconcile_task = None
+# Token de /products/changes hasta el que el índice está al día.
+_sync_token = None
+_sync_lock = asyncio.Lock()
+
+
+def _collect_sections():
+    # Se copia en el hilo del event loop; la serialización va en otro hilo.
+    return {
+        "products": list(product_index.docs.values()),
+        "reference": reference_cache.dump(),
+        "sync": {"token": _sync_token},
+    }
+
+
+async def sync_product_changes():
+    """Aplica al índice y a los agregados los cambios posteriores a `_sync_token`.
+
+    Sin token (o con uno ya purgado) el feed devuelve el catálogo completo y
+    se reconstruye todo. Aplicar de nuevo un cambio ya indexado no altera nada.
+    """
+    global _sync_token
+    async with _sync_lock:
+        applied = 0
+        while True:
+            page = await fetch_product_changes(_sync_token)
+            if page["full_resync"]:
+                product_index.rebuild(page["products"])
+                seller_stats.rebuild(page["products"])
+            else:
+                for row in page["products"]:
+                    product_index.upsert(row)
+                    if not seller_stats.upsert_row(row):
+                        seller_stats.remove(row.get("id_product"))
+                for product_id in page["deleted"]:
+                    product_index.remove(product_id)
+                    seller_stats.remove(product_id)
+            applied += len(page["products"]) + len(page["deleted"])
+            _sync_token = page["token"]
+            if not page["has_more"]:
+                return applied
+
+
+async def save_snapshot():
+    if not product_index.ready:
+        return 0
+    # El token guardado debe cubrir el contenido del índice: primero se pone al día.
+    try:
+        await sync_product_changes()
+    except Exception as e:
+        logger.warning(f"Could not sync product changes before snapshot, keeping token {_sync_token}: {e}")
+    sections = _collect_sections()
+    size = await asyncio.to_thread(write_snapshot, snapshot_path, sections)
+    logger.info(f"Wrote cache snapshot ({len(sections['products'])} products, {size} bytes)")
+    return size
+
+
+async def _reconcile(age: float):
+    if _sync_token is not None:
+        try:
+            applied = await sync_product_changes()
+            logger.info(f"Cache snapshot reconciled with {applied} product changes")
+        except Exception as e:
+            logger.error(f"Error reconciling cache snapshot through the change feed: {e}")
+        else:
+            await asyncio.gather(fetch_categories(), fetch_brands(), return_exceptions=True)
+            return
+    # Sin token no queda más que releer el catálogo. Se reparte en el tiempo para que los
+    # workers que arrancan a la vez no lo lean todos juntos; cuanto más reciente es la
+    # instantánea, más puede esperar.
+    window = min(snapshot_reconcile_jitter_seconds, max(0.0, snapshot_max_age_seconds - age))
+    await asyncio.sleep(random.uniform(0, window))
+    await schedule_search_index_rebuild()
+    await asyncio.gather(fetch_categories(), fetch_brands(), return_exceptions=True)
+
+
+async def load_warm_start():
+    """Carga la instantánea si existe y es reciente. Devuelve True si las cachés quedaron listas.
+
+    Tras cargarla, el índice, los agregados por vendedor y los datos de
+    referencia se reconcilian con la base de datos en segundo plano: con los
+    cambios posteriores al token guardado o, si no lo hay, con una
+    reconstrucción completa diferida.
+    """
+    global _reconcile_task, _sync_token
+    try:
+        created_at, sections = await asyncio.to_thread(read_snapshot, snapshot_path)
+    except FileNotFoundError:
+        return False
+    except (SnapshotError, OSError, ValueError) as e:
+        logger.warning(f"Ignoring cache snapshot {snapshot_path}: {e}")
+        return False
+
+    age = time.time() - created_at
+    if age > snapshot_max_age_seconds:
+        logger.info(f"Cache snapshot is {age:.0f}s old, ignoring it")
+        return False
+
+    rows = sections.get("products", [])
+    product_index.rebuild(rows)
+    seller_stats.rebuild(rows)
+    reference_cache.restore(sections.get("reference", {}))
+    _sync_token = (sections.get("sync") or {}).get("token")
+    logger.info(f"Warm start from cache snapshot ({len(rows)} products, {age:.0f}s old, sync token {_sync_token})")
+
+    _reconcile_task = asyncio.create_task(_reconcile(age))
+    return True
+
+
+async def _snapshot_loop():
+    while True:
+        await asyncio.sleep(snapshot_interval_seconds)
+        try:
+            await save_snapshot()
+        except Exception as e:
+            logger.error(f"Error writing cache snapshot: {e}")
+
+
+def start_snapshots():
+    global _snapshot_task
+    if snapshot_interval_seconds > 0 and _snapshot_task is None:
+        _snapshot_task = asyncio.create_task(_snapshot_loop())
+
+
+async def stop_snapshots():
+    global _snapshot_task
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        _snapshot_task = None
+        try:
+            await save_snapshot()
+        except Exception as e:
+            logger.error(f"Error writing cache snapshot: {e}")
@@ -1,22 +1,43 @@
 # Importa el módulo FastAPI y clases para manejo de peticiones y respuestas.
-from fastapi import FastAPI, Request, Response  
+from fastapi import FastAPI, Request, Response, Query  
 
 # Importa el modelo UserRegister desde el módulo models.Userlogin.
 from models.UserRegister import UserRegister
 from models.UserLogin import UserLogin
 from models.UserActivation import UserActivation
-from models.Product import Product, updateProduct
+from models.FirebaseLogin import FirebaseTokenLogin
+from models.Product import Product, updateProduct, StockDelta
 # Importa las funciones para manejar el inicio de sesión y la autenticación de Office 365 desde el módulo controllers.o365.
 from controllers.o365 import login_o365, auth_callback_o365  
 from controllers.google import login_google , auth_callback_google
-from controllers.firebase import register_user_firebase, login_user_firebase, generate_activation_code, activate_user
-from controllers.product import execute_query, fetch_categories, fetch_brands, create_product, fetch_product_info, update_product
+from controllers.firebase import register_user_firebase, login_user_firebase, login_user_firebase_token, generate_activation_code, activate_user
+from controllers.product import execute_query, fetch_categories, fetch_brands, create_product, fetch_product_info, update_product, delete_product, build_search_index, search_products, export_products, fetch_product_by_id, adjust_product_stock, format_etag, etag_matches
+from controllers.health import liveness, readiness
+from controllers.images import upload_product_image, shutdown_thumbnail_pool, upload_max_bytes
+from controllers.reservations import start_reservations, stop_reservations, reserve_stock, confirm_reservation, release_reservation
+from models.Reservation import Reservation
+from models.Batch import BatchRequest
+from controllers.batch import run_batch
+from controllers.sellers import fetch_seller_stats, start_seller_stats_reconciliation, stop_seller_stats_reconciliation
+from controllers.snapshots import load_warm_start, start_snapshots, stop_snapshots
+from controllers.changes import fetch_product_changes, start_change_log_compaction, stop_change_log_compaction
+from utils.storage import blob_backend, local_blob_root, local_blob_base_url
+from fastapi.staticfiles import StaticFiles
 # Importa el middleware CORS para manejar el intercambio de recursos entre orígenes (CORS).
 from fastapi.middleware.cors import CORSMiddleware  
 from fastapi import Request
 
+# Importa el middleware de compresión de respuestas (gzip / brotli / zstd).
+from utils.compression import CompressionMiddleware
+from utils.database import ReadConsistencyMiddleware
+from utils.profiling import ProfilingMiddleware, sampler, list_profiles, profile_as_text, profile_as_pstats
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from utils.events import product_events
+from utils.query_stats import query_stats
+
 # Importa el decorador para validar JWT desde el módulo utils.security.
-from utils.security import validate, validate_func, validate_for_inactive
+from utils.idempotency import idempotent
+from utils.security import validate, validate_func, validate_for_inactive, is_admin, max_body_size, AuthMiddleware
 
 import logging
 from fastapi import HTTPException
@@ -25,6 +46,9 @@ logger = logging.getLogger("uvicorn")
 # Crea una instancia de la aplicación FastAPI.
 app = FastAPI()  
 
+# Autentica según el decorador de cada ruta antes de leer el cuerpo y limita su tamaño.
+app.add_middleware(AuthMiddleware)
+
 # Configura el middleware CORS para permitir solicitudes desde cualquier origen y permitir todos los métodos y encabezados.
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +58,37 @@ app.add_middleware(
     allow_headers=["*"],  # Permitir todos los encabezados HTTP.
 )
 
+# Comprime las respuestas grandes (/products, /cards, ...) según Accept-Encoding.
+app.add_middleware(CompressionMiddleware)
+
+# Permite forzar lecturas desde el primario (X-Read-Consistency: strong) tras una escritura.
+app.add_middleware(ReadConsistencyMiddleware)
+
+# Perfila con cProfile las peticiones que traen X-Profile-Key (clave de función).
+app.add_middleware(ProfilingMiddleware)
+
+# Con el backend local las imágenes se sirven desde el propio servicio.
+if blob_backend == "local":
+    app.mount(local_blob_base_url, StaticFiles(directory=local_blob_root, check_dir=False), name="media")
+
+# Construye el índice de búsqueda de productos al arrancar (o lo carga de la instantánea local).
+@app.on_event("startup")
+async def startup():
+    if not await load_warm_start():
+        await build_search_index()
+    start_snapshots()
+    await start_reservations()
+    start_change_log_compaction()
+    start_seller_stats_reconciliation()
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_thumbnail_pool()
+    await stop_reservations()
+    stop_change_log_compaction()
+    stop_seller_stats_reconciliation()
+    await stop_snapshots()
+
 # Define una ruta GET en la raíz de la aplicación que devuelve un mensaje de saludo y la versión de la aplicación.
 @app.get("/")  
 async def hello():  
@@ -42,6 +97,21 @@ async def hello():
         "version": "0.1.16"  
     }  
 
+# Liveness: el proceso responde. No consulta dependencias.
+@app.get("/healthz")
+async def healthz(response: Response):
+    response.headers["Cache-Control"] = "no-cache"
+    return await liveness()
+
+# Readiness: base de datos, cola e identidad, con latencias y saturación del pool (sin detalles internos).
+@app.get("/readyz")
+async def readyz(response: Response):
+    response.headers["Cache-Control"] = "no-cache"
+    report = await readiness()
+    if report["status"] != "ready":
+        response.status_code = 503
+    return report
+
 # Define una ruta GET para manejar el inicio de sesión, llamando a la función login_o365.
 @app.get("/login")  
 async def login(request: Request):  
@@ -77,18 +147,25 @@ async def authcallbackgoogle(request: Request):
     return await auth_callback_google(request)
 
 
+# Con `Idempotency-Key` los reintentos devuelven la respuesta del primer intento.
 @app.post("/register")
-async def register(user: UserRegister):
+@idempotent(replay_errors=False)
+async def register(request: Request, user: UserRegister):
     return await register_user_firebase(user)
 
 @app.post("/login/custom")
 async def login_custom(user: UserLogin):
     return await login_user_firebase(user)
 
+# Login con un ID token de Firebase obtenido en el cliente, verificado localmente.
+@app.post("/login/firebase")
+async def login_firebase(login: FirebaseTokenLogin):
+    return await login_user_firebase_token(login)
+
 @app.get("/cards")
 async def cards(request: Request, response: Response):
     response.headers["Cache-Control"] = "no-cache"
-    return await execute_query("SELECT * FROM [commette].[cards]")
+    return await execute_query("SELECT * FROM [commette].[cards]", read_only=True)
 
 @app.post("/user/{email}/code")
 @validate_func
@@ -118,6 +195,7 @@ async def get_brands(request: Request, response: Response):
 
 @app.post("/product")
 @validate
+@idempotent()
 async def add_product(request: Request, response: Response, product: Product):
     response.headers["Cache-Control"] = "no-cache"
     return await create_product(product)
@@ -128,11 +206,74 @@ async def get_products(request: Request, response: Response):
     return await fetch_product_info()
 
 
+@app.get("/products/search")
+@validate
+async def get_products_search(
+    request: Request,
+    response: Response,
+    q: str = None,
+    category: str = None,
+    brand: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+):
+    return await search_products(q, category, brand, min_price, max_price, page, page_size)
+
+
+@app.get("/products/export")
+@validate
+async def get_products_export(
+    request: Request,
+    response: Response,
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    user_id: int = None,
+):
+    # Los vendedores solo pueden exportar su propio inventario; los administradores, todo.
+    if not is_admin(request):
+        if user_id is not None and user_id != request.state.id_user:
+            raise HTTPException(status_code=403, detail="Not allowed to export other sellers' products")
+        user_id = request.state.id_user
+    return export_products(format, user_id)
+
+
+# Sincronización incremental del catálogo: solo lo que cambió desde el token `since`.
+@app.get("/products/changes")
+@validate
+async def get_products_changes(request: Request, response: Response, since: str = None):
+    response.headers["Cache-Control"] = "no-cache"
+    return await fetch_product_changes(since)
+
+
+# Cambios de productos y stock en vivo (Server-Sent Events) en lugar de sondear /products.
+@app.get("/products/stream")
+@validate
+async def get_products_stream(
+    request: Request,
+    response: Response,
+    seller: int = None,
+    category: str = None,
+    ids: str = Query(None, pattern=r"^\d+(,\d+)*$"),
+):
+    product_ids = [int(product_id) for product_id in ids.split(",")] if ids else None
+    subscription = product_events.subscribe(seller=seller, category=category, product_ids=product_ids)
+    return StreamingResponse(
+        product_events.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/products/{product_id}")
 @validate
 async def get_products_by_user_id(request: Request, response: Response, product_id: int):
-    query = f"EXEC commette.get_product_by_id @ProductID = {product_id}"
-    result = await execute_query(query)
+    result, version = await fetch_product_by_id(product_id)
+    etag = format_etag(version)
+    if etag:
+        response.headers["ETag"] = etag
+        if etag_matches(request.headers.get("If-None-Match"), version):
+            return Response(status_code=304, headers={"ETag": etag})
     return result
 
 
@@ -140,31 +281,152 @@ async def get_products_by_user_id(request: Request, response: Response, product_
 @validate
 async def get_products_by_user_id(request: Request, response: Response, user_id: int):
     query = f"EXEC commette.get_products_by_user_id @UserID = {user_id}"
-    result = await execute_query(query)
+    result = await execute_query(query, read_only=True)
     return result
 
+# Resumen del inventario de un vendedor (agregados en memoria, sin descargar sus productos).
+@app.get("/sellers/{seller_id}/stats")
+@validate
+async def get_seller_stats(request: Request, response: Response, seller_id: int):
+    if not is_admin(request) and seller_id != request.state.id_user:
+        raise HTTPException(status_code=403, detail="Not allowed to read other sellers' stats")
+    response.headers["Cache-Control"] = "no-cache"
+    return await fetch_seller_stats(seller_id)
+
 @app.delete("/product/{product_id}")
 @validate
 async def delete_product_by_id(request: Request, response: Response, product_id: int):
     try:
-        query = f"EXEC commette.delete_product_and_inventory @id_product = {product_id}"
-        result = await execute_query(query)
+        result = await delete_product(product_id, request.headers.get("If-Match"))
         if result is None:
             response.status_code = 404
             return {"detail": "Product not found"}
         return {"detail": "Product and associated inventory deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/product/{product_id}")
 @validate
 async def update_product_endpoint(request: Request, response: Response, product_id: int, product: updateProduct):
-    print(product)
-    try:
-        result = await update_product(product)
-        return result
-    except HTTPException as e:
-        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    # El id de la ruta manda; el del cuerpo solo se acepta si coincide.
+    if product.id_product != product_id:
+        raise HTTPException(status_code=400, detail="Product id in body does not match the URL")
+    result, version = await update_product(product, request.headers.get("If-Match"))
+    response.headers["ETag"] = format_etag(version)
+    return result
+
+# Sube la imagen en streaming (multipart, campo `file`) y guarda solo la URL en el producto.
+@app.post("/product/{product_id}/image")
+@validate
+@max_body_size(upload_max_bytes)
+async def upload_product_image_endpoint(request: Request, response: Response, product_id: int):
+    response.headers["Cache-Control"] = "no-cache"
+    return await upload_product_image(request, product_id, request.state.id_user, is_admin(request))
+
+@app.patch("/product/{product_id}/stock")
+@validate
+async def adjust_stock_endpoint(request: Request, response: Response, product_id: int, stock: StockDelta):
+    result, version = await adjust_product_stock(product_id, stock.delta, request.headers.get("If-Match"))
+    response.headers["ETag"] = format_etag(version)
+    response.headers["Cache-Control"] = "no-cache"
+    return result
+
+# Agrupa varias lecturas (GET) en una sola petición: un JWT y una conexión compartida.
+@app.post("/batch")
+@validate
+async def batch(request: Request, response: Response, batch: BatchRequest):
+    response.headers["Cache-Control"] = "no-cache"
+    return await run_batch(request, batch.requests)
+
+# Reservas de stock: se descuentan en memoria y se escriben en SQL Server por lotes.
+@app.post("/reservations")
+@validate
+async def create_reservation(request: Request, response: Response, reservation: Reservation):
+    response.headers["Cache-Control"] = "no-cache"
+    return await reserve_stock(reservation.id_product, reservation.quantity, request.state.id_user)
+
+@app.post("/reservations/{reservation_id}/confirm")
+@validate
+async def confirm_reservation_endpoint(request: Request, response: Response, reservation_id: str):
+    return await confirm_reservation(reservation_id, request.state.id_user, is_admin(request))
+
+@app.delete("/reservations/{reservation_id}")
+@validate
+async def release_reservation_endpoint(request: Request, response: Response, reservation_id: str):
+    return await release_reservation(reservation_id, request.state.id_user, is_admin(request))
+
+# Diagnóstico en caliente: perfiles por petición y muestreador de pilas (clave de función).
+@app.get("/admin/profiles")
+@validate_func
+async def admin_profiles(request: Request):
+    return list_profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+@validate_func
+async def admin_profile(request: Request, profile_id: str, format: str = Query("text", pattern="^(text|pstats)$"), sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$")):
+    if format == "pstats":
+        data = profile_as_pstats(profile_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return Response(
+            content=data,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'},
+        )
+    text = profile_as_text(profile_id, sort)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(text)
+
+@app.get("/admin/sampler")
+@validate_func
+async def admin_sampler_status(request: Request):
+    return sampler.status()
+
+@app.post("/admin/sampler/start")
+@validate_func
+async def admin_sampler_start(request: Request, interval_ms: float = Query(None, gt=0)):
+    sampler.start(interval_ms)
+    return sampler.status()
+
+@app.post("/admin/sampler/stop")
+@validate_func
+async def admin_sampler_stop(request: Request):
+    sampler.stop()
+    return sampler.status()
+
+@app.delete("/admin/sampler")
+@validate_func
+async def admin_sampler_reset(request: Request):
+    sampler.reset()
+    return sampler.status()
+
+# Pilas en formato "collapsed" para flamegraph.pl / speedscope.
+@app.get("/admin/sampler/flamegraph")
+@validate_func
+async def admin_sampler_flamegraph(request: Request):
+    return PlainTextResponse(
+        sampler.collapsed(),
+        headers={"Content-Disposition": 'attachment; filename="flamegraph.collapsed"'},
+    )
+
+# Consultas SQL agrupadas por huella, ordenadas por tiempo total (clave de función).
+@app.get("/admin/queries")
+@validate_func
+async def admin_queries(
+    request: Request,
+    limit: int = Query(20, ge=1, le=500),
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|calls|rows|bytes|slow_calls)$"),
+):
+    return query_stats.top(limit, sort)
+
+@app.delete("/admin/queries")
+@validate_func
+async def admin_queries_reset(request: Request):
+    query_stats.reset()
+    return {"detail": "Query statistics reset"}
 
 
 # Ejecuta la aplicación FastAPI usando uvicorn si el script se ejecuta directamente.
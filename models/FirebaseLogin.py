@@ -0,0 +1,4 @@
+from pydantic import BaseModel, Field
+
+class FirebaseTokenLogin(BaseModel):
+    idToken: str = Field(..., min_length=1, description="ID token de Firebase obtenido en el cliente")
@@ -1,11 +1,14 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 
+from models.validation import ImageUrl
+
 class Product(BaseModel):
     id_brand: int
     id_category: int
     product_name: str 
-    product_image: str
+    # La imagen se sube aparte (POST /product/{id}/image); aquí solo se acepta una URL.
+    product_image: Optional[ImageUrl] = None
     product_description: str
     id_seller: int
     price: float
@@ -18,4 +21,7 @@ class updateProduct(BaseModel):
     product_name: str 
     product_description: str
     price: float
-    stock: int
\ No newline at end of file
+    stock: int
+
+class StockDelta(BaseModel):
+    delta: int = Field(..., description="Unidades a sumar (positivo) o restar (negativo) al stock")
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+
+class Reservation(BaseModel):
+    id_product: int
+    quantity: int = Field(..., gt=0)
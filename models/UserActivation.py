@@ -1,16 +1,7 @@
-from pydantic import BaseModel, validator
-from typing import Optional
-import re
+from pydantic import BaseModel
 
-from utils.globalf import validate_sql_injection
+from models.validation import Email
 
 class UserActivation(BaseModel):
-    email: str
+    email: Email
     code: int
-
-    @validator('email')
-    def email_validation(cls, value):
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", value):
-            raise ValueError('Invalid email address')
-
-        return value
\ No newline at end of file
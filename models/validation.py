@@ -0,0 +1,87 @@
+import re
+
+from urllib.parse import urlsplit
+from typing import Annotated
+
+from pydantic import AfterValidator
+
+from utils.globalf import validate_sql_injection
+from utils.storage import image_hosts, local_blob_base_url
+
+# Patrones compilados una sola vez y compartidos por todos los modelos de usuario.
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+USERNAME_RE = re.compile(r"[a-zA-Z0-9_]+")
+UPPERCASE_RE = re.compile(r"[A-Z]")
+SPECIAL_CHAR_RE = re.compile(r"[\W_]")
+NUMBER_SEQUENCE_RE = re.compile(r"012|123|234|345|456|567|678|789|890")
+# Sin espacios ni comillas: la URL se interpola en la llamada al procedimiento.
+IMAGE_URL_RE = re.compile(r"[^\s'\"]+")
+IMAGE_URL_MAX_LENGTH = 2048
+
+
+def check_email(value: str) -> str:
+    if not EMAIL_RE.match(value):
+        raise ValueError('Invalid email address')
+    return value
+
+
+def check_password(value: str) -> str:
+    if len(value) < 6:
+        raise ValueError('Password must be at least 6 characters long')
+
+    if not UPPERCASE_RE.search(value):
+        raise ValueError('Password must contain at least one uppercase letter')
+
+    if not SPECIAL_CHAR_RE.search(value):
+        raise ValueError('Password must contain at least one special character')
+
+    if NUMBER_SEQUENCE_RE.search(value):
+        raise ValueError('Password must not contain a sequence of numbers')
+
+    return value
+
+
+def check_name(value: str) -> str:
+    if validate_sql_injection(value):
+        raise ValueError('Invalid name')
+    return value
+
+
+def check_username(value: str) -> str:
+    if validate_sql_injection(value):
+        raise ValueError('Invalid username')
+
+    if len(value) < 3:
+        raise ValueError('Username must be at least 3 characters long')
+
+    if not USERNAME_RE.fullmatch(value):
+        raise ValueError('Username can only contain alphanumeric characters and underscores')
+
+    return value
+
+
+def check_image_url(value: str):
+    if not value:
+        return None
+
+    if len(value) > IMAGE_URL_MAX_LENGTH:
+        raise ValueError(f'Image URL must be at most {IMAGE_URL_MAX_LENGTH} characters long')
+
+    # Solo URLs de nuestro almacenamiento o de hosts permitidos; nunca data URIs.
+    parts = urlsplit(value)
+    if parts.scheme in ("http", "https"):
+        allowed = (parts.hostname or "").lower() in image_hosts
+    else:
+        allowed = not parts.scheme and not parts.netloc and value.startswith(local_blob_base_url.rstrip("/") + "/")
+    if not allowed or not IMAGE_URL_RE.fullmatch(value) or ".." in value.split("/"):
+        raise ValueError('Image must be an http(s) or storage URL; upload files to /product/{id}/image')
+
+    return value
+
+
+# Tipos anotados: pydantic v2 compila la validación en el esquema del modelo al definir la clase.
+Email = Annotated[str, AfterValidator(check_email)]
+Password = Annotated[str, AfterValidator(check_password)]
+Name = Annotated[str, AfterValidator(check_name)]
+Username = Annotated[str, AfterValidator(check_username)]
+ImageUrl = Annotated[str, AfterValidator(check_image_url)]
@@ -0,0 +1,12 @@
+-- Control de concurrencia optimista para productos (PUT/DELETE con If-Match y PATCH de stock).
+-- row_version cambia en cada UPDATE de la fila y se expone como ETag.
+-- updated_at permite forzar el cambio de versión cuando solo cambia el inventario.
+
+ALTER TABLE [commette].[Product]
+    ADD row_version ROWVERSION;
+GO
+
+ALTER TABLE [commette].[Product]
+    ADD updated_at DATETIME2 NOT NULL
+        CONSTRAINT DF_Product_updated_at DEFAULT SYSUTCDATETIME();
+GO
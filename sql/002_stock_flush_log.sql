@@ -0,0 +1,11 @@
+-- Registro de los lotes de stock escritos por el motor de reservas.
+-- Cada flush inserta su flush_id en la misma transacción que descuenta el stock,
+-- así al recuperar tras una caída se sabe si un lote ya se aplicó.
+
+CREATE TABLE [commette].[StockFlushLog] (
+    flush_id UNIQUEIDENTIFIER NOT NULL
+        CONSTRAINT PK_StockFlushLog PRIMARY KEY,
+    flushed_at DATETIME2 NOT NULL
+        CONSTRAINT DF_StockFlushLog_flushed_at DEFAULT SYSUTCDATETIME()
+);
+GO
@@ -0,0 +1,93 @@
+-- Registro de cambios del catálogo para la sincronización incremental (GET /products/changes).
+-- Los triggers lo alimentan desde cualquier escritura sobre Product o Inventory, incluidas
+-- las de los procedimientos existentes, sin modificarlos.
+-- change_version es un rowversion: el token de sincronización es su valor como BIGINT y las
+-- lecturas se limitan a versiones por debajo de MIN_ACTIVE_ROWVERSION(), así una transacción
+-- aún abierta nunca queda por detrás de un token ya entregado.
+
+CREATE TABLE [commette].[ProductChangeLog] (
+    change_version ROWVERSION NOT NULL
+        CONSTRAINT PK_ProductChangeLog PRIMARY KEY,
+    id_product INT NOT NULL,
+    -- 'U' = alta o modificación, 'D' = baja (tombstone)
+    operation CHAR(1) NOT NULL,
+    changed_at DATETIME2 NOT NULL
+        CONSTRAINT DF_ProductChangeLog_changed_at DEFAULT SYSUTCDATETIME()
+);
+GO
+
+CREATE INDEX IX_ProductChangeLog_product
+    ON [commette].[ProductChangeLog] (id_product, change_version);
+GO
+
+-- Versión hasta la que se han purgado tombstones: un token anterior exige resincronización completa.
+CREATE TABLE [commette].[ProductChangeLogState] (
+    id TINYINT NOT NULL
+        CONSTRAINT PK_ProductChangeLogState PRIMARY KEY
+        CONSTRAINT CK_ProductChangeLogState_single CHECK (id = 1),
+    pruned_through BIGINT NOT NULL
+);
+GO
+
+INSERT INTO [commette].[ProductChangeLogState] (id, pruned_through) VALUES (1, 0);
+GO
+
+CREATE TRIGGER [commette].[trg_Product_change_log]
+ON [commette].[Product]
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO [commette].[ProductChangeLog] (id_product, operation)
+    SELECT i.id_product, 'U' FROM inserted i
+    UNION ALL
+    SELECT d.id_product, 'D' FROM deleted d
+    WHERE NOT EXISTS (SELECT 1 FROM inserted i WHERE i.id_product = d.id_product);
+END;
+GO
+
+CREATE TRIGGER [commette].[trg_Inventory_change_log]
+ON [commette].[Inventory]
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO [commette].[ProductChangeLog] (id_product, operation)
+    SELECT i.id_product, 'U' FROM inserted i
+    WHERE EXISTS (SELECT 1 FROM [commette].[Product] p WHERE p.id_product = i.id_product);
+END;
+GO
+
+-- Compacta el registro: conserva solo la última entrada de cada producto y purga los
+-- tombstones más antiguos que @retention_days, avanzando pruned_through.
+CREATE PROCEDURE [commette].[compact_product_changes]
+    @retention_days INT = 30
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DELETE c
+    FROM [commette].[ProductChangeLog] c
+    WHERE EXISTS (
+        SELECT 1 FROM [commette].[ProductChangeLog] n
+        WHERE n.id_product = c.id_product AND n.change_version > c.change_version
+    );
+
+    DECLARE @pruned BIGINT;
+    SELECT @pruned = MAX(CAST(change_version AS BIGINT))
+    FROM [commette].[ProductChangeLog]
+    WHERE operation = 'D' AND changed_at < DATEADD(DAY, -@retention_days, SYSUTCDATETIME());
+
+    IF @pruned IS NOT NULL
+    BEGIN
+        BEGIN TRANSACTION;
+        UPDATE [commette].[ProductChangeLogState]
+        SET pruned_through = @pruned
+        WHERE id = 1 AND pruned_through < @pruned;
+        DELETE FROM [commette].[ProductChangeLog]
+        WHERE operation = 'D' AND change_version <= CAST(@pruned AS BINARY(8));
+        COMMIT;
+    END;
+END;
+GO
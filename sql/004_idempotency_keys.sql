@@ -0,0 +1,22 @@
+-- Respuestas de POST /product y POST /register por Idempotency-Key (IDEMPOTENCY_BACKEND=sql).
+-- La fila se inserta sin respuesta al empezar la petición (reserva) y se completa al terminar,
+-- así un reintento concurrente en otro worker sabe que la primera sigue en curso.
+
+CREATE TABLE [commette].[IdempotencyKey] (
+    -- sha256 de método, ruta, usuario y clave enviada por el cliente
+    idempotency_key CHAR(64) NOT NULL
+        CONSTRAINT PK_IdempotencyKey PRIMARY KEY,
+    -- sha256 del cuerpo de la petición: la misma clave con otro cuerpo se rechaza
+    request_hash CHAR(64) NOT NULL,
+    status_code INT NULL,
+    response_headers NVARCHAR(MAX) NULL,
+    response_body VARBINARY(MAX) NULL,
+    created_at DATETIME2 NOT NULL
+        CONSTRAINT DF_IdempotencyKey_created_at DEFAULT SYSUTCDATETIME(),
+    expires_at DATETIME2 NOT NULL
+);
+GO
+
+CREATE INDEX IX_IdempotencyKey_expires_at
+    ON [commette].[IdempotencyKey] (expires_at);
+GO
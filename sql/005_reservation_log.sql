@@ -0,0 +1,24 @@
+-- Confirmaciones y liberaciones de reservas de stock (POST /reservations/{id}/confirm, DELETE).
+-- La fila se inserta en la misma transacción que descuenta el stock: una reserva solo se
+-- confirma una vez aunque el cliente reintente o llegue a otra instancia, y una reserva
+-- liberada ya no se puede confirmar.
+-- Sustituye a StockFlushLog (002): las confirmaciones ya no se escriben de forma diferida.
+
+CREATE TABLE [commette].[ReservationLog] (
+    reservation_id CHAR(32) NOT NULL
+        CONSTRAINT PK_ReservationLog PRIMARY KEY,
+    -- 'confirmed' o 'released'
+    status VARCHAR(10) NOT NULL,
+    id_product INT NOT NULL,
+    quantity INT NOT NULL,
+    created_at DATETIME2 NOT NULL
+        CONSTRAINT DF_ReservationLog_created_at DEFAULT SYSUTCDATETIME()
+);
+GO
+
+CREATE INDEX IX_ReservationLog_created_at
+    ON [commette].[ReservationLog] (created_at);
+GO
+
+DROP TABLE IF EXISTS [commette].[StockFlushLog];
+GO
@@ -0,0 +1,19 @@
+import os
+import sys
+import types
+
+# Clave de pruebas para los JWT propios (sesión, ids de reserva).
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-enough-length-for-hs256")
+
+# Las pruebas no abren conexiones: si el driver de SQL Server no está instalado
+# se registra un módulo mínimo para poder importar utils.database.
+try:
+    import pymssql  # noqa: F401
+except ImportError:
+    class _Error(Exception):
+        pass
+
+    pymssql = types.ModuleType("pymssql")
+    pymssql.Error = pymssql.DatabaseError = pymssql.OperationalError = pymssql.IntegrityError = _Error
+    pymssql.connect = lambda **kwargs: (_ for _ in ()).throw(_Error("No database in tests"))
+    sys.modules["pymssql"] = pymssql
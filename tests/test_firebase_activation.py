@@ -0,0 +1,137 @@
+import sys
+import json
+import types
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from models.UserRegister import UserRegister
+from models.UserActivation import UserActivation
+from models.FirebaseLogin import FirebaseTokenLogin
+from utils.jwks import PublicKeyCache
+from tests.test_firebase_tokens import PROJECT_ID, KID, signing_key, jwks_fetcher, make_token
+
+EMAIL = "ana.perez@example.com"
+
+
+class FakeFirebaseAuth(types.ModuleType):
+    """Usuarios de Firebase Authentication en memoria."""
+
+    def __init__(self):
+        super().__init__("firebase_admin.auth")
+        self.users = {}
+
+    def create_user(self, email, password):
+        record = SimpleNamespace(uid=f"uid-{len(self.users) + 1}", email=email, email_verified=False)
+        self.users[email] = record
+        return record
+
+    def get_user_by_email(self, email):
+        return self.users[email]
+
+    def update_user(self, uid, email_verified):
+        record = next(r for r in self.users.values() if r.uid == uid)
+        record.email_verified = email_verified
+
+    def delete_user(self, uid):
+        self.users = {email: r for email, r in self.users.items() if r.uid != uid}
+
+
+class FakeCursor:
+    def execute(self, *args):
+        pass
+
+    def fetchone(self):
+        return (42,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def firebase(monkeypatch):
+    # El módulo inicializa Firebase Admin y la cola de Azure al importarse: se sustituyen ambos.
+    auth = FakeFirebaseAuth()
+    credentials = types.ModuleType("firebase_admin.credentials")
+    credentials.Certificate = lambda path: SimpleNamespace(project_id=PROJECT_ID)
+    firebase_admin = types.ModuleType("firebase_admin")
+    firebase_admin.initialize_app = lambda cred: None
+    firebase_admin.credentials, firebase_admin.auth = credentials, auth
+    queue = types.ModuleType("azure.storage.queue")
+    queue.QueueClient = SimpleNamespace(from_connection_string=lambda *args: SimpleNamespace(send_message=lambda m: None))
+    queue.BinaryBase64DecodePolicy = queue.BinaryBase64EncodePolicy = lambda: SimpleNamespace(encode=lambda m: m)
+    for name, module in {
+        "firebase_admin": firebase_admin,
+        "firebase_admin.credentials": credentials,
+        "firebase_admin.auth": auth,
+        "azure": types.ModuleType("azure"),
+        "azure.storage": types.ModuleType("azure.storage"),
+        "azure.storage.queue": queue,
+    }.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(sys.modules, "controllers.firebase", raising=False)
+    module = importlib.import_module("controllers.firebase")
+    monkeypatch.delitem(sys.modules, "controllers.firebase")
+
+    async def fetch_query_as_json(query, is_procedure=False):
+        if "activation_codes" in query:
+            return json.dumps([{"email": EMAIL, "status": "active"}])
+        return json.dumps([{"status": 200}])
+
+    async def get_db_connection():
+        return FakeConnection()
+
+    async def check_exists(table, column, value):
+        return False
+
+    async def issue_token_for_email(email):
+        return {"email": email}
+
+    monkeypatch.setattr(module, "fetch_query_as_json", fetch_query_as_json)
+    monkeypatch.setattr(module, "get_db_connection", get_db_connection)
+    monkeypatch.setattr(module, "check_exists", check_exists)
+    monkeypatch.setattr(module, "issue_token_for_email", issue_token_for_email)
+    monkeypatch.setattr(module.requests, "post", lambda *args, **kwargs: SimpleNamespace(status_code=201))
+    monkeypatch.setattr(module, "firebase_project_id", PROJECT_ID)
+    monkeypatch.setattr(module, "firebase_keys", PublicKeyCache("https://keys.invalid", jwks_fetcher((KID, signing_key))))
+    return module, auth
+
+
+def firebase_login(module, auth):
+    # Firebase emite el ID token con el estado actual de la cuenta.
+    record = auth.users[EMAIL]
+    token = make_token(sub=record.uid, email=EMAIL, email_verified=record.email_verified)
+    return asyncio.run(module.login_user_firebase_token(FirebaseTokenLogin(idToken=token)))
+
+
+def test_register_activate_then_firebase_login(firebase):
+    module, auth = firebase
+    asyncio.run(module.register_user_firebase(UserRegister(
+        email=EMAIL, password="Secreta!Clave", firstname="Ana", lastname="Pérez", username="ana_perez",
+    )))
+
+    with pytest.raises(HTTPException) as rejected:
+        firebase_login(module, auth)
+    assert rejected.value.status_code == 403
+
+    asyncio.run(module.activate_user(UserActivation(email=EMAIL, code=123456)))
+
+    assert auth.users[EMAIL].email_verified is True
+    assert firebase_login(module, auth) == {"email": EMAIL}
@@ -0,0 +1,87 @@
+import json
+import time
+import asyncio
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from utils.jwks import PublicKeyCache
+from utils.firebase_tokens import verify_firebase_id_token, UnverifiedEmailError, FIREBASE_ISSUER
+
+PROJECT_ID = "commette-test"
+KID = "local-key"
+
+# Claves generadas localmente: el caché las recibe por el fetcher inyectable, sin red.
+signing_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def jwks_fetcher(*keys):
+    document = {"keys": []}
+    for kid, key in keys:
+        jwk = json.loads(RSAAlgorithm.to_jwk(key.public_key()))
+        jwk.update(kid=kid, use="sig", alg="RS256")
+        document["keys"].append(jwk)
+
+    async def fetch(url):
+        return document, 3600
+    return fetch
+
+
+def make_token(key=signing_key, kid=KID, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": FIREBASE_ISSUER.format(project_id=PROJECT_ID),
+        "aud": PROJECT_ID,
+        "sub": "uid-1",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+        "email": "ana.perez@example.com",
+        "email_verified": True,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+def verify(token):
+    cache = PublicKeyCache("https://keys.invalid", jwks_fetcher((KID, signing_key)))
+    return asyncio.run(verify_firebase_id_token(token, cache, PROJECT_ID))
+
+
+def test_valid_token():
+    claims = verify(make_token())
+    assert claims["email"] == "ana.perez@example.com"
+    assert claims["sub"] == "uid-1"
+
+
+@pytest.mark.parametrize("token", [
+    make_token(aud="another-project"),
+    make_token(iss="https://securetoken.google.com/another-project"),
+    make_token(iat=int(time.time()) - 7200, exp=int(time.time()) - 3600),
+    make_token(kid="unknown-key"),
+    make_token(key=other_key),
+    make_token(auth_time=int(time.time()) + 3600),
+], ids=["bad-aud", "bad-iss", "expired", "unknown-kid", "bad-signature", "future-auth-time"])
+def test_invalid_token_is_rejected(token):
+    with pytest.raises(jwt.PyJWTError):
+        verify(token)
+
+
+def test_unsigned_token_is_rejected():
+    token = jwt.encode({"sub": "uid-1", "aud": PROJECT_ID}, "s" * 32, algorithm="HS256", headers={"kid": KID})
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        verify(token)
+
+
+@pytest.mark.parametrize("overrides", [
+    {"email_verified": False},
+    {"email_verified": "true"},
+    {"email_verified": None},
+    {"email": None},
+])
+def test_unverified_email_is_rejected(overrides):
+    with pytest.raises(UnverifiedEmailError):
+        verify(make_token(**overrides))
@@ -0,0 +1,177 @@
+import asyncio
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from controllers import reservations
+from utils.reservations import ReservationEngine
+
+
+class FakeInventory:
+    """Replica en memoria de lo que hacen en SQL Server las escrituras de confirmación y liberación."""
+
+    def __init__(self, stock: dict):
+        self.stock = dict(stock)
+        self.log = {}
+        self.batches = []
+        self.fail = 0
+
+    def write_confirmations(self, items):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("connection lost")
+        self.batches.append([item["id"] for item in items])
+        results = {}
+        for item in items:
+            rid, product_id, quantity = item["id"], item["id_product"], item["quantity"]
+            if rid in self.log:
+                results[rid] = "duplicate" if self.log[rid] == "confirmed" else "released"
+            elif product_id not in self.stock:
+                results[rid] = "missing"
+            elif self.stock[product_id] >= quantity:
+                self.stock[product_id] -= quantity
+                self.log[rid] = "confirmed"
+                results[rid] = "confirmed"
+            else:
+                results[rid] = "insufficient"
+        return {item["id"]: (results[item["id"]], self.stock.get(item["id_product"])) for item in items}
+
+    def write_release(self, reservation):
+        return self.log.setdefault(reservation["id"], "released")
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    inventory = FakeInventory({1: 5})
+    monkeypatch.setattr(reservations, "_write_confirmations", inventory.write_confirmations)
+    monkeypatch.setattr(reservations, "_write_release", inventory.write_release)
+    return inventory
+
+
+def instance(stock=5):
+    """Una instancia de la API con su propio motor en memoria."""
+    engine = ReservationEngine(60)
+    engine.load(1, stock)
+    return engine
+
+
+def use(monkeypatch, engine):
+    monkeypatch.setattr(reservations, "engine", engine)
+
+
+def test_confirm_is_written_before_responding(monkeypatch, inventory):
+    engine = instance()
+    use(monkeypatch, engine)
+
+    async def run():
+        reservation = await reservations.reserve_stock(1, 5, id_user=7)
+        return await reservations.confirm_reservation(reservation["id"], id_user=7)
+
+    assert asyncio.run(run())["status"] == "confirmed"
+    assert inventory.stock[1] == 0
+    assert engine.held(1) == 0
+    assert engine.counters[1].stock == 0
+
+
+def test_two_instances_cannot_confirm_the_same_units(monkeypatch, inventory):
+    a, b = instance(), instance()
+
+    async def run():
+        use(monkeypatch, a)
+        first = await reservations.reserve_stock(1, 5, id_user=7)
+        use(monkeypatch, b)
+        second = await reservations.reserve_stock(1, 5, id_user=8)
+        await reservations.confirm_reservation(second["id"], id_user=8)
+        use(monkeypatch, a)
+        with pytest.raises(HTTPException) as rejected:
+            await reservations.confirm_reservation(first["id"], id_user=7)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 409
+    assert inventory.stock[1] == 0
+    assert a.held(1) == 0
+
+
+def test_confirm_on_another_instance_and_retry_apply_once(monkeypatch, inventory):
+    a, b = instance(), instance()
+
+    async def run():
+        use(monkeypatch, a)
+        reservation = await reservations.reserve_stock(1, 2, id_user=7)
+        use(monkeypatch, b)
+        on_b = await reservations.confirm_reservation(reservation["id"], id_user=7)
+        use(monkeypatch, a)
+        retried = await reservations.confirm_reservation(reservation["id"], id_user=7)
+        return on_b, retried
+
+    on_b, retried = asyncio.run(run())
+    assert on_b["status"] == retried["status"] == "confirmed"
+    assert inventory.stock[1] == 3
+
+
+def test_concurrent_confirms_share_one_transaction(monkeypatch, inventory):
+    use(monkeypatch, instance())
+
+    async def run():
+        tokens = [(await reservations.reserve_stock(1, 1, id_user=7))["id"] for _ in range(5)]
+        # La misma reserva dos veces a la vez espera a la misma escritura.
+        tokens.append(tokens[0])
+        return await asyncio.gather(*[reservations.confirm_reservation(t, id_user=7) for t in tokens])
+
+    results = asyncio.run(run())
+    assert all(r["status"] == "confirmed" for r in results)
+    assert inventory.stock[1] == 0
+    assert sum(len(batch) for batch in inventory.batches) == 5
+    assert len(inventory.batches) <= 2
+
+
+def test_released_reservation_cannot_be_confirmed(monkeypatch, inventory):
+    a, b = instance(), instance()
+
+    async def run():
+        use(monkeypatch, a)
+        reservation = await reservations.reserve_stock(1, 2, id_user=7)
+        use(monkeypatch, b)
+        await reservations.release_reservation(reservation["id"], id_user=7)
+        with pytest.raises(HTTPException) as rejected:
+            await reservations.confirm_reservation(reservation["id"], id_user=7)
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 409
+    assert inventory.stock[1] == 5
+
+
+def test_failed_write_is_reported_and_can_be_retried(monkeypatch, inventory):
+    engine = instance()
+    use(monkeypatch, engine)
+    inventory.fail = 1
+
+    async def run():
+        reservation = await reservations.reserve_stock(1, 2, id_user=7)
+        with pytest.raises(HTTPException) as failed:
+            await reservations.confirm_reservation(reservation["id"], id_user=7)
+        assert failed.value.status_code == 503
+        return await reservations.confirm_reservation(reservation["id"], id_user=7)
+
+    assert asyncio.run(run())["status"] == "confirmed"
+    assert inventory.stock[1] == 3
+    assert engine.held(1) == 0
+
+
+def test_reservation_ids_are_signed_and_owned(monkeypatch, inventory):
+    use(monkeypatch, instance())
+
+    async def run():
+        reservation = await reservations.reserve_stock(1, 2, id_user=7)
+        claims = jwt.decode(reservation["id"], options={"verify_signature": False})
+        forged = jwt.encode({**claims, "qty": 1}, "another-secret-key-with-enough-length", algorithm="HS256")
+        session = jwt.encode({"id_user": 7, "exp": claims["exp"]}, reservations.SECRET_KEY, algorithm="HS256")
+        for token, user, status in [(reservation["id"], 8, 403), (forged, 7, 404), (session, 7, 404)]:
+            with pytest.raises(HTTPException) as rejected:
+                await reservations.confirm_reservation(token, id_user=user)
+            assert rejected.value.status_code == status
+
+    asyncio.run(run())
+    assert inventory.stock[1] == 5
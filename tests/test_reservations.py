@@ -0,0 +1,53 @@
+import pytest
+
+from utils.reservations import ReservationEngine, InsufficientStock
+
+
+def test_reserve_never_oversells():
+    engine = ReservationEngine(ttl_seconds=60)
+    engine.load(1, 5)
+    engine.reserve(1, 3)
+    with pytest.raises(InsufficientStock):
+        engine.reserve(1, 3)
+    engine.reserve(1, 2)
+    assert engine.held(1) == 5
+
+
+def test_confirm_rechecks_known_stock():
+    engine = ReservationEngine(ttl_seconds=60)
+    engine.load(1, 5)
+    reservation = engine.reserve(1, 5)
+    # Otro escritor vendió parte del stock antes de confirmar.
+    engine.set_stock(1, 3)
+    with pytest.raises(InsufficientStock):
+        engine.begin_confirm(reservation["id"])
+    assert engine.held(1) == 0
+    assert reservation["status"] == "released"
+
+
+def test_confirm_applies_delta_over_concurrent_stock_change():
+    engine = ReservationEngine(ttl_seconds=60)
+    engine.load(1, 5)
+    reservation = engine.begin_confirm(engine.reserve(1, 2)["id"])
+    # Un PATCH confirmado mientras se escribía la confirmación sube el stock a 20.
+    engine.set_stock(1, 20)
+    engine.confirm_finished(reservation, held=True, applied=True, stock=3)
+    assert engine.counters[1].stock == 18
+    assert engine.held(1) == 0
+
+
+def test_rejected_confirm_never_raises_known_stock():
+    engine = ReservationEngine(ttl_seconds=60)
+    engine.load(1, 5)
+    reservation = engine.begin_confirm(engine.reserve(1, 5)["id"])
+    engine.confirm_finished(reservation, held=True, applied=False, stock=2)
+    assert engine.counters[1].stock == 2
+    assert engine.held(1) == 0
+
+
+def test_expire_releases_held_units():
+    engine = ReservationEngine(ttl_seconds=60)
+    engine.load(1, 5)
+    engine.reserve(1, 5)
+    assert engine.expire(now=engine.reservations[next(iter(engine.reservations))]["expires_at"]) == 1
+    assert engine.held(1) == 0
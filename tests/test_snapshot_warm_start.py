@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from controllers import snapshots
+from utils.search import product_index
+from utils.seller_stats import seller_stats
+from utils.snapshot import write_snapshot
+
+
+def product(product_id, stock, name="Producto"):
+    return {"id_product": product_id, "id_user": 7, "product_name": name, "stock": stock, "price": 10.0}
+
+
+@pytest.fixture
+def feed(monkeypatch, tmp_path):
+    calls = {"since": [], "rebuilds": 0}
+    pages = {}
+
+    async def fetch_product_changes(since=None):
+        calls["since"].append(since)
+        return pages[since]
+
+    async def schedule_search_index_rebuild():
+        calls["rebuilds"] += 1
+
+    async def fetch_reference():
+        return []
+
+    monkeypatch.setattr(snapshots, "snapshot_path", str(tmp_path / "cache-snapshot.bin"))
+    monkeypatch.setattr(snapshots, "fetch_product_changes", fetch_product_changes)
+    monkeypatch.setattr(snapshots, "schedule_search_index_rebuild", schedule_search_index_rebuild)
+    monkeypatch.setattr(snapshots, "fetch_categories", fetch_reference)
+    monkeypatch.setattr(snapshots, "fetch_brands", fetch_reference)
+    monkeypatch.setattr(snapshots, "_sync_token", None)
+    return pages, calls
+
+
+def test_warm_start_reconciles_incrementally_from_snapshot_token(feed):
+    pages, calls = feed
+    write_snapshot(snapshots.snapshot_path, {
+        "products": [product(1, 5), product(2, 3)],
+        "reference": {},
+        "sync": {"token": "100"},
+    })
+    pages["100"] = {"token": "120", "full_resync": False, "has_more": True, "products": [product(1, 4)], "deleted": []}
+    pages["120"] = {"token": "130", "full_resync": False, "has_more": False, "products": [], "deleted": [2]}
+
+    async def scenario():
+        assert await snapshots.load_warm_start()
+        await snapshots._reconcile_task
+
+    asyncio.run(scenario())
+
+    assert calls == {"since": ["100", "120"], "rebuilds": 0}
+    assert snapshots._sync_token == "130"
+    assert product_index.docs[1]["stock"] == 4
+    assert 2 not in product_index.docs
+    assert seller_stats.stats(7)["total_stock"] == 4
+
+
+def test_snapshot_without_token_delays_full_rebuild(feed, monkeypatch):
+    pages, calls = feed
+    write_snapshot(snapshots.snapshot_path, {"products": [product(1, 5)], "reference": {}})
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(snapshots.asyncio, "sleep", sleep)
+    monkeypatch.setattr(snapshots.random, "uniform", lambda low, high: high)
+
+    async def scenario():
+        assert await snapshots.load_warm_start()
+        await snapshots._reconcile_task
+
+    asyncio.run(scenario())
+
+    assert calls == {"since": [], "rebuilds": 1}
+    assert delays == [snapshots.snapshot_reconcile_jitter_seconds]
+
+
+def test_save_snapshot_stores_the_token_the_index_is_synced_to(feed):
+    pages, calls = feed
+    pages[None] = {"token": "200", "full_resync": True, "has_more": False, "products": [product(1, 5)], "deleted": []}
+    product_index.rebuild([product(1, 5)])
+
+    asyncio.run(snapshots.save_snapshot())
+
+    _, sections = snapshots.read_snapshot(snapshots.snapshot_path)
+    assert sections["sync"] == {"token": "200"}
+    assert calls["since"] == [None]
@@ -0,0 +1,293 @@
+import os
+import gzip
+import zlib
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+# brotli y zstandard son opcionales: si no están instalados solo se negocia gzip.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tamaño mínimo (bytes) para comprimir una respuesta; por debajo no compensa el CPU.
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+# Niveles de compresión por algoritmo.
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+# Algoritmos habilitados, en orden de preferencia del servidor.
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+# Cuerpos más grandes que esto se comprimen fuera del event loop.
+COMPRESSION_THREAD_THRESHOLD = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", str(256 * 1024)))
+# Caché de cuerpos ya comprimidos (número de entradas y bytes totales).
+COMPRESSION_CACHE_ENTRIES = int(os.getenv("COMPRESSION_CACHE_ENTRIES", "256"))
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# SSE necesita que cada evento llegue al cliente en cuanto se emite.
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def available_encodings():
+    encodings = []
+    for encoding in (e.strip() for e in COMPRESSION_ENCODINGS.split(",")):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if encoding == "br" and brotli is None:
+            continue
+        if encoding in ("zstd", "br", "gzip"):
+            encodings.append(encoding)
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, encodings=None):
+    """Elige el algoritmo según Accept-Encoding (q-values) y la preferencia del servidor."""
+    encodings = encodings if encodings is not None else available_encodings()
+    if not accept_encoding or not encodings:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        name = parts[0].lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_LEVEL)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class StreamCompressor:
+    """Compresor incremental: cada chunk se emite con flush para no retener datos."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=COMPRESSION_BROTLI_LEVEL)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._obj.compress(chunk) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._obj.process(chunk) + self._obj.flush()
+        return self._obj.compress(chunk) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "gzip":
+            return self._obj.flush()
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class CompressedBodyCache:
+    """LRU de cuerpos comprimidos indexado por el hash del cuerpo original.
+
+    Un mismo cuerpo (por ejemplo el catálogo servido desde una caché del
+    servidor) se comprime una vez por algoritmo y se reutiliza después.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(body: bytes, encoding: str):
+        return (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if self.max_entries <= 0 or len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+compressed_cache = CompressedBodyCache(COMPRESSION_CACHE_ENTRIES, COMPRESSION_CACHE_MAX_BYTES)
+
+
+async def get_compressed(body: bytes, encoding: str) -> bytes:
+    key = CompressedBodyCache.key(body, encoding)
+    compressed = compressed_cache.get(key)
+    if compressed is not None:
+        return compressed
+
+    if len(body) >= COMPRESSION_THREAD_THRESHOLD:
+        compressed = await run_in_threadpool(compress_body, body, encoding)
+    else:
+        compressed = compress_body(body, encoding)
+    compressed_cache.put(key, compressed)
+    return compressed
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(UNCOMPRESSIBLE_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime respuestas con gzip, brotli o zstd."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+        logger.info(f"Compresión habilitada: {self.encodings}")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.passthrough = False
+        self.compressor = None
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            self.passthrough = not is_compressible(Headers(raw=message["headers"]))
+            if self.passthrough:
+                await self._send(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            chunk = self.compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += self.compressor.finish()
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+
+        if not more_body:
+            # Respuesta completa: se comprime de una vez (con caché) si supera el mínimo.
+            if len(body) >= self.minimum_size:
+                body = await get_compressed(body, self.encoding)
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(body))
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        # Respuesta en streaming: se comprime chunk a chunk sin acumular el cuerpo.
+        self.compressor = StreamCompressor(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self._send(self.start_message)
+        await self._send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body) if body else b"",
+            "more_body": True,
+        })
@@ -1,11 +1,18 @@
 from dotenv import load_dotenv
 import os
+import time
 import pymssql
 import logging
 import json
+import threading
 
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from decimal import Decimal
 
+from utils.query_stats import query_stats
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -24,20 +31,385 @@ connection_string = {
     'database': database
 }
 
-async def get_db_connection():
+# Réplica de solo lectura opcional. Con SQL_READ_ONLY_INTENT=true se conecta con
+# ApplicationIntent=ReadOnly (el listener del grupo de disponibilidad enruta a una réplica).
+read_server = os.getenv('SQL_READ_SERVER')
+read_only_intent = os.getenv('SQL_READ_ONLY_INTENT', 'false').lower() == 'true'
+read_connection_string = {
+    **connection_string,
+    'server': read_server or server,
+}
+if read_only_intent:
+    read_connection_string['read_only'] = True
+
+# Tras un fallo de la réplica, segundos durante los que las lecturas van directamente al primario.
+replica_retry_seconds = float(os.getenv('SQL_READ_RETRY_SECONDS', '30'))
+
+# Número de filas que se piden al cursor en cada fetchmany al hacer streaming.
+stream_batch_size = int(os.getenv('SQL_STREAM_BATCH_SIZE', '500'))
+
+# Tamaño del pool de conexiones y tiempo máximo que una conexión ociosa se reutiliza.
+pool_size = int(os.getenv('SQL_POOL_SIZE', '10'))
+pool_max_idle_seconds = float(os.getenv('SQL_POOL_MAX_IDLE_SECONDS', '300'))
+
+
+class InstrumentedCursor:
+    """Cursor que mide cada consulta (ejecución + lectura) y la registra en query_stats.
+
+    La consulta se da por terminada al ejecutar la siguiente o al cerrar el cursor.
+    """
+
+    def __init__(self, cursor, pool_name):
+        self._cursor = cursor
+        self._pool_name = pool_name
+        self._query = None
+        self._params = None
+        self._elapsed = 0.0
+        self._rows = 0
+        self.bytes_produced = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception:
+            self._elapsed += time.perf_counter() - start
+            self._finish(error=True)
+            raise
+        finally:
+            if self._query is not None:
+                self._elapsed += time.perf_counter() - start
+
+    def _finish(self, error=False):
+        if self._query is None:
+            return
+        query_stats.record(
+            self._query,
+            self._elapsed * 1000,
+            rows=self._rows,
+            size=self.bytes_produced,
+            error=error,
+            pool=self._pool_name,
+            params=self._params,
+        )
+        self._query = None
+
+    def execute(self, operation, params=None):
+        self._finish()
+        self._query = operation
+        self._params = params
+        self._elapsed = 0.0
+        self._rows = 0
+        self.bytes_produced = 0
+        if params is None:
+            return self._timed(self._cursor.execute, operation)
+        return self._timed(self._cursor.execute, operation, params)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, size) if size else self._timed(self._cursor.fetchmany)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def nextset(self):
+        return self._timed(self._cursor.nextset)
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+
+class PooledConnection:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._pool.name)
+
+    def discard(self):
+        # Para conexiones que fallaron: se cierran en vez de volver al pool.
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn, discard=True)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+
+class ConnectionPool:
+    """Pool de conexiones pymssql.
+
+    Nunca bloquea: si todas las conexiones están en uso se abre una conexión
+    adicional que se cierra al devolverla. `max_size` limita las conexiones que
+    se mantienen abiertas y sirve de referencia para medir la saturación.
+    """
+
+    def __init__(self, name, params, max_size):
+        self.name = name
+        self.params = params
+        self.max_size = max_size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.overflow = 0
+        self.opened = 0
+
+    def _connect(self):
+        try:
+            logger.info(f"Intentando conectar a la base de datos en el servidor: {self.params.get('server')}")
+            conn = pymssql.connect(**self.params)
+            logger.info("Conexión exitosa a la base de datos.")
+            return conn
+        except pymssql.Error as e:
+            logger.error(f"Database connection error: {str(e)}")
+            raise Exception(f"Database connection error: {str(e)}")
+
+    def acquire(self):
+        conn = None
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                candidate, released_at = self._idle.pop()
+                if now - released_at <= pool_max_idle_seconds:
+                    conn = candidate
+                    break
+                self._close_quietly(candidate)
+            self.in_use += 1
+            if self.in_use > self.max_size:
+                self.overflow += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            self.opened += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                # Igual que al cerrar una conexión, lo que no se confirmó se descarta.
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self.in_use -= 1
+            if not discard and len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "saturation": round(self.in_use / self.max_size, 2) if self.max_size else None,
+                "overflow_total": self.overflow,
+                "opened_total": self.opened,
+            }
+
+
+primary_pool = ConnectionPool('primary', connection_string, pool_size)
+replica_pool = (
+    ConnectionPool('replica', read_connection_string, int(os.getenv('SQL_READ_POOL_SIZE', str(pool_size))))
+    if read_server or read_only_intent else None
+)
+_replica_down_until = 0.0
+
+# Lectura de lo propio: cuando está activo, las lecturas de la petición actual van al primario.
+_prefer_primary = ContextVar('prefer_primary', default=False)
+
+def use_primary_for_reads():
+    _prefer_primary.set(True)
+
+def _acquire(read_only=False):
+    global _replica_down_until
+    if not read_only:
+        _prefer_primary.set(True)
+    elif replica_pool is not None and not _prefer_primary.get() and time.monotonic() >= _replica_down_until:
+        try:
+            return replica_pool.acquire()
+        except Exception as e:
+            _replica_down_until = time.monotonic() + replica_retry_seconds
+            logger.warning(f"Read replica unavailable, falling back to primary: {e}")
+    return primary_pool.acquire()
+
+
+class _BorrowedConnection:
+    def __init__(self, shared):
+        self._shared = shared
+
+    def __getattr__(self, name):
+        return getattr(self._shared.lease, name)
+
+    def cursor(self, *args, **kwargs):
+        return self._shared.lease.cursor(*args, **kwargs)
+
+    def discard(self):
+        self._shared.give_back(discard=True)
+
+    def close(self):
+        self._shared.give_back()
+
+
+class SharedConnection:
+    """Conexión de lectura que comparten varias operaciones (p. ej. las subpeticiones de /batch).
+
+    Solo una operación la usa a la vez; si está ocupada, la siguiente toma una
+    conexión normal del pool.
+    """
+
+    def __init__(self):
+        self.lease = None
+        self.reused = 0
+        self._busy = False
+        self._lock = threading.Lock()
+
+    def borrow(self):
+        with self._lock:
+            if self._busy:
+                return None
+            self._busy = True
+        if self.lease is None:
+            try:
+                self.lease = _acquire(read_only=True)
+            except Exception:
+                self._busy = False
+                raise
+        else:
+            self.reused += 1
+        return _BorrowedConnection(self)
+
+    def give_back(self, discard=False):
+        with self._lock:
+            if not self._busy:
+                return
+            if discard and self.lease is not None:
+                self.lease.discard()
+                self.lease = None
+            self._busy = False
+
+    def close(self):
+        if self.lease is not None:
+            self.lease.close()
+            self.lease = None
+
+
+_shared_connection = ContextVar('shared_connection', default=None)
+
+@contextmanager
+def shared_read_connection():
+    shared = SharedConnection()
+    token = _shared_connection.set(shared)
     try:
-        logger.info(f"Intentando conectar a la base de datos en el servidor: {server}")
-        conn = pymssql.connect(**connection_string)
-        logger.info("Conexión exitosa a la base de datos.")
-        return conn
+        yield shared
+    finally:
+        _shared_connection.reset(token)
+        shared.close()
+
+def open_db_connection(read_only=False):
+    """Conexión del pool primario, o de la réplica si la operación es de solo lectura.
+
+    Si la réplica no responde se usa el primario y se deja de intentar la réplica
+    durante `replica_retry_seconds`. Cualquier conexión no marcada como de solo
+    lectura activa la lectura de lo propio para el resto de la petición. Dentro
+    de `shared_read_connection()` las lecturas reutilizan una misma conexión.
+    """
+    shared = _shared_connection.get()
+    if read_only and shared is not None and not _prefer_primary.get():
+        conn = shared.borrow()
+        if conn is not None:
+            return conn
+    return _acquire(read_only)
+
+async def get_db_connection(read_only=False):
+    return open_db_connection(read_only)
+
+
+class ReadConsistencyMiddleware:
+    """Con `X-Read-Consistency: strong` todas las lecturas de la petición van al primario.
+
+    Los clientes lo envían justo después de una escritura para leer lo que acaban de escribir.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"x-read-consistency" and value.lower() == b"strong":
+                    _prefer_primary.set(True)
+                    break
+        await self.app(scope, receive, send)
+
+def iter_query_batches(query, batch_size=None, read_only=True):
+    """Ejecuta el query y devuelve (columnas, filas) por lotes sin materializar el resultado.
+
+    Es un generador síncrono pensado para StreamingResponse, que lo consume en el
+    threadpool; la conexión se cierra al terminar o si el cliente se desconecta.
+    """
+    batch_size = batch_size or stream_batch_size
+    conn = open_db_connection(read_only)
+    cursor = conn.cursor()
+    logger.debug(f"Ejecutando query en streaming: {query}")
+    try:
+        cursor.execute(query)
+        if cursor.description is None:
+            return
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield columns, rows
     except pymssql.Error as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise Exception(f"Database connection error: {str(e)}")
+        conn.discard()
+        raise Exception(f"Error ejecutando el query: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
 
-async def fetch_query_as_json(query, is_procedure=False):
-    conn = await get_db_connection()
+async def fetch_query_as_json(query, is_procedure=False, read_only=False):
+    conn = await get_db_connection(read_only)
     cursor = conn.cursor()
-    logger.info(f"Ejecutando query: {query}")
+    logger.debug(f"Ejecutando query: {query}")
     try:
         cursor.execute(query)
 
@@ -47,19 +419,29 @@ async def fetch_query_as_json(query, is_procedure=False):
 
         columns = [column[0] for column in cursor.description]
         results = []
-        logger.info(f"Columns: {columns}")
+        logger.debug(f"Columns: {columns}")
         for row in cursor.fetchall():
             row_dict = dict(zip(columns, row))
             results.append(decimal_to_float(row_dict))
 
-        return json.dumps(results)
+        result_json = json.dumps(results)
+        cursor.bytes_produced = len(result_json)
+        return result_json
 
     except pymssql.Error as e:
+        conn.discard()
         raise Exception(f"Error ejecutando el query: {str(e)}")
     finally:
         cursor.close()
         conn.close()
 
+def rows_as_dicts(cursor):
+    """Filas del result set actual del cursor como lista de diccionarios."""
+    if cursor.description is None:
+        return []
+    columns = [column[0] for column in cursor.description]
+    return [decimal_to_float(dict(zip(columns, row))) for row in cursor.fetchall()]
+
 def decimal_to_float(obj):
     if isinstance(obj, Decimal):
         return float(obj)
@@ -68,4 +450,19 @@ def decimal_to_float(obj):
     elif isinstance(obj, list):
         return [decimal_to_float(i) for i in obj]
     else:
-        return obj
\ No newline at end of file
+        return obj
+
+
+def ping_database(pool=None):
+    """Consulta mínima (SELECT 1) usada por los health checks."""
+    conn = (pool or primary_pool).acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    except pymssql.Error as e:
+        conn.discard()
+        raise Exception(f"Error ejecutando el query: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
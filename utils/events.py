@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+import logging
+import itertools
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Eventos pendientes que puede acumular cada suscriptor antes de desconectarlo.
+event_buffer_size = int(os.getenv("EVENT_BUFFER_SIZE", "256"))
+# Segundos entre heartbeats cuando no hay eventos.
+event_heartbeat_seconds = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+# Bytes precalculados: un comentario SSE es el mensaje más barato que mantiene viva la conexión.
+HEARTBEAT = b": ping\n\n"
+DROPPED = b"event: dropped\ndata: {\"detail\": \"Subscriber too slow, resync required\"}\n\n"
+
+# Campos (en orden de preferencia) con los que se filtra cada evento.
+SELLER_FIELDS = ("id_user", "id_seller")
+CATEGORY_FIELDS = ("id_category", "category_name")
+
+
+def stock_payload(product_id, stock, doc: dict = None):
+    """Evento de stock: solo los campos de filtro del producto y el stock nuevo."""
+    data = {field: doc[field] for field in SELLER_FIELDS + CATEGORY_FIELDS if doc and field in doc}
+    data.update({"id_product": product_id, "stock": stock})
+    return data
+
+
+def _first(data: dict, fields):
+    for field in fields:
+        if data.get(field) is not None:
+            return str(data[field]).lower()
+    return None
+
+
+class Subscription:
+    def __init__(self, seller=None, category=None, product_ids=None, maxsize=event_buffer_size):
+        self.seller = str(seller).lower() if seller is not None else None
+        self.category = str(category).lower() if category is not None else None
+        self.product_ids = set(product_ids) if product_ids else None
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def matches(self, product_id, data: dict) -> bool:
+        if self.product_ids is not None and product_id not in self.product_ids:
+            return False
+        if self.seller is not None and _first(data, SELLER_FIELDS) != self.seller:
+            return False
+        if self.category is not None and _first(data, CATEGORY_FIELDS) != self.category:
+            return False
+        return True
+
+
+class EventBroker:
+    """Pub/sub en proceso para cambios de productos.
+
+    Cada evento se serializa una sola vez. Un suscriptor que no consume y llena
+    su buffer se desconecta (recibe `event: dropped`) en lugar de frenar al resto.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, **filters) -> Subscription:
+        subscription = Subscription(**filters)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, event_type: str, product_id, data: dict = None):
+        if not self.subscribers:
+            return
+        data = data or {"id_product": product_id}
+        event_id = next(self._ids)
+        payload = (
+            f"id: {event_id}\nevent: {event_type}\n"
+            f"data: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+        ).encode("utf-8")
+        self.published += 1
+
+        for subscription in list(self.subscribers):
+            if subscription.dropped or not subscription.matches(product_id, data):
+                continue
+            try:
+                subscription.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        subscription.dropped = True
+        self.subscribers.discard(subscription)
+        self.dropped += 1
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(DROPPED)
+        logger.warning("Dropped slow event subscriber")
+
+    async def stream(self, subscription: Subscription):
+        """Generador de bytes SSE para StreamingResponse."""
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    payload = await asyncio.wait_for(subscription.queue.get(), event_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                yield payload
+                if payload is DROPPED:
+                    break
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+product_events = EventBroker()
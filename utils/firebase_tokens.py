@@ -0,0 +1,32 @@
+import time
+
+import jwt
+
+from utils.jwks import PublicKeyCache, decode_verified, jwt_leeway_seconds
+
+FIREBASE_ISSUER = "https://securetoken.google.com/{project_id}"
+
+
+class UnverifiedEmailError(jwt.InvalidTokenError):
+    pass
+
+
+async def verify_firebase_id_token(id_token: str, key_cache: PublicKeyCache, project_id: str):
+    """Valida un ID token de Firebase y devuelve sus claims.
+
+    Exige firma, `aud`/`iss` del proyecto, fechas y `auth_time` válidos, y un
+    email verificado: solo así el email sirve para identificar al usuario.
+    Lanza `jwt.PyJWTError` (o `UnverifiedEmailError`) si el token no es válido.
+    """
+    claims = await decode_verified(
+        id_token,
+        key_cache,
+        audience=project_id,
+        issuer=FIREBASE_ISSUER.format(project_id=project_id),
+    )
+    auth_time = claims.get("auth_time")
+    if auth_time is None or auth_time > time.time() + jwt_leeway_seconds:
+        raise jwt.InvalidTokenError("Invalid auth_time")
+    if not claims.get("email") or claims.get("email_verified") is not True:
+        raise UnverifiedEmailError("Firebase account has no verified email")
+    return claims
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import hmac
+import asyncio
+import hashlib
+import secrets
+import logging
+
+from collections import OrderedDict
+from functools import wraps
+
+import pymssql
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from utils.database import get_db_connection
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "memory" guarda las respuestas en el proceso; "sql" las comparte entre workers (sql/004_idempotency_keys.sql).
+idempotency_backend = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+idempotency_ttl_seconds = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+idempotency_max_entries = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Tras este tiempo una reserva "en curso" se considera abandonada (worker caído).
+idempotency_pending_timeout = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT_SECONDS", "120"))
+# Clave del HMAC del cuerpo: el hash guardado no permite adivinar campos como la contraseña.
+# Debe ser la misma en todos los workers para que coincidan los hashes del backend "sql".
+idempotency_secret = (os.getenv("IDEMPOTENCY_SECRET") or os.getenv("SECRET_KEY") or secrets.token_hex(32)).encode()
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Encabezados de la respuesta original que no se guardan para el replay.
+_SKIP_HEADERS = {"content-length", "date", "server"}
+# Errores transitorios que nunca se repiten desde la caché.
+_RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+class MemoryIdempotencyStore:
+    """LRU acotado con caducidad por TTL, local al proceso."""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._records = OrderedDict()
+
+    async def get(self, key: str):
+        item = self._records.get(key)
+        if item is None:
+            return None
+        expires_at, record = item
+        if expires_at < time.monotonic():
+            del self._records[key]
+            return None
+        self._records.move_to_end(key)
+        return record
+
+    async def reserve(self, key: str, fingerprint: str) -> bool:
+        # Dentro del proceso las peticiones concurrentes ya esperan al futuro en curso.
+        return True
+
+    async def put(self, key: str, record: dict):
+        self._records[key] = (time.monotonic() + self.ttl, record)
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    async def release(self, key: str):
+        pass
+
+
+class SqlIdempotencyStore:
+    """Registros compartidos en SQL Server.
+
+    `reserve` inserta una fila sin respuesta; un reintento que llega a otro
+    worker mientras la primera petición sigue en curso recibe 409.
+    """
+
+    async def get(self, key: str):
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT request_hash, status_code, response_headers, response_body
+                FROM [commette].[IdempotencyKey]
+                WHERE idempotency_key = %s AND status_code IS NOT NULL AND expires_at > SYSUTCDATETIME()
+                """,
+                (key,)
+            )
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if row is None:
+            return None
+        return {"fingerprint": row[0], "status": row[1], "headers": json.loads(row[2]), "body": bytes(row[3])}
+
+    async def reserve(self, key: str, fingerprint: str) -> bool:
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # Toma la clave si no existe, si caducó o si su reserva quedó abandonada.
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+                DELETE FROM [commette].[IdempotencyKey]
+                WHERE idempotency_key = %s
+                  AND (expires_at <= SYSUTCDATETIME()
+                       OR (status_code IS NULL AND created_at < DATEADD(SECOND, -%d, SYSUTCDATETIME())));
+                INSERT INTO [commette].[IdempotencyKey] (idempotency_key, request_hash, expires_at)
+                VALUES (%s, %s, DATEADD(SECOND, %d, SYSUTCDATETIME()));
+                """,
+                (key, idempotency_pending_timeout, key, fingerprint, idempotency_ttl_seconds)
+            )
+            conn.commit()
+            return True
+        except pymssql.IntegrityError:
+            conn.discard()
+            return False
+        except Exception:
+            conn.discard()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    async def put(self, key: str, record: dict):
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+                UPDATE [commette].[IdempotencyKey]
+                SET status_code = %d, response_headers = %s, response_body = %s
+                WHERE idempotency_key = %s;
+                DELETE TOP (100) FROM [commette].[IdempotencyKey] WHERE expires_at <= SYSUTCDATETIME();
+                """,
+                (record["status"], json.dumps(record["headers"]), record["body"], key)
+            )
+            conn.commit()
+        except Exception:
+            conn.discard()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    async def release(self, key: str):
+        conn = await get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM [commette].[IdempotencyKey] WHERE idempotency_key = %s AND status_code IS NULL",
+                (key,)
+            )
+            conn.commit()
+        except Exception:
+            conn.discard()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def create_store(kind: str):
+    if kind == "sql":
+        return SqlIdempotencyStore()
+    return MemoryIdempotencyStore(idempotency_max_entries, idempotency_ttl_seconds)
+
+
+class _InFlight:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class IdempotencyManager:
+    """Ejecuta una sola vez cada clave y repite la respuesta guardada en los reintentos."""
+
+    def __init__(self, store):
+        self.store = store
+        self._inflight = {}
+
+    @staticmethod
+    def _replay(record: dict, fingerprint: str):
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        response = Response(content=record["body"], status_code=record["status"])
+        for name, value in record["headers"]:
+            response.headers.append(name, value)
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+    async def run(self, key: str, fingerprint: str, call, replay_errors: bool = True):
+        while True:
+            record = await self.store.get(key)
+            if record is not None:
+                return self._replay(record, fingerprint)
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            if inflight.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            # Reintento concurrente: espera el resultado del primer intento.
+            record = await asyncio.shield(inflight.future)
+            if record is not None:
+                return self._replay(record, fingerprint)
+            # El primer intento falló sin respuesta reutilizable: este lo vuelve a ejecutar.
+
+        # Se registra antes de reservar para que los reintentos del mismo proceso esperen a este.
+        inflight = self._inflight[key] = _InFlight(fingerprint)
+        record = None
+        reserved = False
+        try:
+            reserved = await self.store.reserve(key, fingerprint)
+            if not reserved:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+            try:
+                response = await call()
+            except HTTPException as e:
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+                if self._storable(response.status_code, replay_errors):
+                    record = await self._save(key, fingerprint, response)
+                raise
+            if self._storable(response.status_code, replay_errors):
+                record = await self._save(key, fingerprint, response)
+            return response
+        finally:
+            if reserved and record is None:
+                try:
+                    await self.store.release(key)
+                except Exception as e:
+                    logger.error(f"Error releasing idempotency key: {e}")
+            inflight.future.set_result(record)
+            del self._inflight[key]
+
+    @staticmethod
+    def _storable(status: int, replay_errors: bool) -> bool:
+        if 200 <= status < 300:
+            return True
+        return replay_errors and 400 <= status < 500 and status not in _RETRYABLE_STATUS
+
+    async def _save(self, key: str, fingerprint: str, response: Response):
+        record = {
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "headers": [
+                [name, value] for name, value in response.headers.items()
+                if name.lower() not in _SKIP_HEADERS
+            ],
+            "body": bytes(response.body),
+        }
+        try:
+            await self.store.put(key, record)
+        except Exception as e:
+            # La petición ya se ejecutó: no se falla por no poder guardarla.
+            logger.error(f"Error storing idempotent response: {e}")
+            return None
+        return record
+
+
+idempotency = IdempotencyManager(create_store(idempotency_backend))
+
+
+def request_fingerprint(request, user, kwargs) -> str:
+    """HMAC de método, ruta, usuario y cuerpo (modelos pydantic normalizados)."""
+    digest = hmac.new(idempotency_secret, f"{request.method} {request.url.path} {user}".encode(), hashlib.sha256)
+    for name in sorted(kwargs):
+        if isinstance(kwargs[name], BaseModel):
+            digest.update(name.encode())
+            digest.update(kwargs[name].model_dump_json().encode())
+    return digest.hexdigest()
+
+
+async def _call_as_response(func, args, kwargs):
+    result = await func(*args, **kwargs)
+    if isinstance(result, Response):
+        return result
+    # Se serializa aquí para poder guardar exactamente los bytes devueltos.
+    sub_response = kwargs.get("response")
+    response = JSONResponse(jsonable_encoder(result), status_code=getattr(sub_response, "status_code", None) or 200)
+    if sub_response is not None:
+        for name, value in sub_response.headers.items():
+            if name.lower() not in ("content-length", "content-type"):
+                response.headers[name] = value
+    return response
+
+
+# Define un decorador que aplica `Idempotency-Key` al endpoint (necesita el parámetro `request`).
+def idempotent(replay_errors: bool = True):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get("request")
+            key = request.headers.get(IDEMPOTENCY_HEADER) if request is not None else None
+            if not key:
+                return await func(*args, **kwargs)
+            if len(key) > 255:
+                raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+
+            user = getattr(request.state, "id_user", None)
+            # La clave se limita al método, la ruta y el usuario; se guarda como hash de longitud fija.
+            scoped_key = hashlib.sha256(f"{request.method}:{request.url.path}:{user}:{key}".encode()).hexdigest()
+            return await idempotency.run(
+                scoped_key,
+                request_fingerprint(request, user, kwargs),
+                lambda: _call_as_response(func, args, kwargs),
+                replay_errors=replay_errors,
+            )
+        return wrapper
+    return decorator
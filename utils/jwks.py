@@ -0,0 +1,194 @@
+import os
+import re
+import time
+import asyncio
+import logging
+
+import jwt
+import aiohttp
+from dotenv import load_dotenv
+from cryptography.x509 import load_pem_x509_certificate
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Vigencia de las claves cuando la respuesta no trae Cache-Control.
+jwks_default_max_age = float(os.getenv("JWKS_DEFAULT_MAX_AGE_SECONDS", "3600"))
+# Margen antes de caducar en el que se refrescan en segundo plano.
+jwks_refresh_margin = float(os.getenv("JWKS_REFRESH_MARGIN_SECONDS", "300"))
+# Intervalo mínimo entre descargas forzadas por un `kid` desconocido.
+jwks_min_refresh_interval = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL_SECONDS", "60"))
+jwks_fetch_timeout = float(os.getenv("JWKS_FETCH_TIMEOUT_SECONDS", "5"))
+# Tolerancia de reloj al validar exp/iat/nbf.
+jwt_leeway_seconds = float(os.getenv("JWT_LEEWAY_SECONDS", "30"))
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def parse_max_age(cache_control: str):
+    if not cache_control or "no-store" in cache_control or "no-cache" in cache_control:
+        return None
+    match = _MAX_AGE.search(cache_control)
+    return float(match.group(1)) if match else None
+
+
+async def fetch_json(url: str):
+    """Descarga un documento JSON. Devuelve (documento, max_age del Cache-Control)."""
+    timeout = aiohttp.ClientTimeout(total=jwks_fetch_timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            document = await response.json(content_type=None)
+            return document, parse_max_age(response.headers.get("Cache-Control"))
+
+
+def load_public_keys(document: dict):
+    """Claves por `kid` a partir de un JWKS (`{"keys": [...]}`) o de un mapa `kid -> certificado PEM`."""
+    keys = {}
+    if "keys" in document:
+        for jwk in document["keys"]:
+            if jwk.get("use", "sig") != "sig" or "kid" not in jwk:
+                continue
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk).key
+            except jwt.PyJWTError as e:
+                logger.warning(f"Skipping unsupported JWK {jwk.get('kid')}: {e}")
+    else:
+        for kid, pem in document.items():
+            keys[kid] = load_pem_x509_certificate(pem.encode()).public_key()
+    return keys
+
+
+class CachedDocument:
+    """Documento JSON remoto cacheado según el Cache-Control del proveedor.
+
+    Antes de caducar se refresca en segundo plano sin bloquear a quien lo usa;
+    si la descarga falla se sigue usando la copia anterior. `fetcher` es
+    inyectable (async, devuelve `(documento, max_age)`) para pruebas locales.
+    """
+
+    def __init__(self, url, fetcher=None):
+        self.url = url
+        self.fetcher = fetcher or fetch_json
+        self.document = None
+        self.expires_at = 0.0
+        self.last_fetch = 0.0
+        self._task = None
+
+    async def _url(self):
+        return await self.url() if callable(self.url) else self.url
+
+    def _load(self, document):
+        self.document = document
+
+    async def _fetch(self):
+        try:
+            document, max_age = await self.fetcher(await self._url())
+            self._load(document)
+            self.expires_at = time.monotonic() + (max_age if max_age is not None else jwks_default_max_age)
+        finally:
+            self.last_fetch = time.monotonic()
+
+    def refresh(self):
+        # Una sola descarga en curso: las llamadas concurrentes esperan la misma tarea.
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._fetch())
+        return self._task
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background refresh failed: {task.exception()}")
+
+    async def get(self):
+        now = time.monotonic()
+        if self.document is None:
+            await self.refresh()
+        elif now >= self.expires_at:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Refresh failed, using cached document: {e}")
+        elif now >= self.expires_at - jwks_refresh_margin:
+            self.refresh().add_done_callback(self._log_failure)
+        return self.document
+
+
+class PublicKeyCache(CachedDocument):
+    """Claves públicas de firma (JWKS o certificados x509) indexadas por `kid`."""
+
+    def __init__(self, url, fetcher=None):
+        super().__init__(url, fetcher)
+        self.keys = {}
+
+    def _load(self, document):
+        self.keys = load_public_keys(document)
+        self.document = document
+        logger.info(f"Loaded {len(self.keys)} signing keys")
+
+    async def get_key(self, kid: str):
+        await self.get()
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.last_fetch >= jwks_min_refresh_interval:
+            # Rotación de claves antes de que caduque la caché.
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+
+class OpenIDProvider:
+    """Proveedor OIDC: documento de discovery y JWKS cacheados, validación local del id_token."""
+
+    def __init__(self, discovery_url: str, client_id: str, issuers=(), fetcher=None):
+        self.client_id = client_id
+        self.discovery = CachedDocument(discovery_url, fetcher)
+        self.keys = PublicKeyCache(self._jwks_uri, fetcher)
+        # Emisores adicionales aceptados además del publicado en el discovery.
+        self.issuers = set(issuers)
+
+    async def _jwks_uri(self):
+        return (await self.discovery.get())["jwks_uri"]
+
+    async def metadata(self):
+        return await self.discovery.get()
+
+    async def validate_id_token(self, id_token: str):
+        metadata = await self.metadata()
+        claims = await decode_verified(id_token, self.keys, audience=self.client_id, issuer=None)
+        # Microsoft publica el emisor con `{tenantid}` para las autoridades multi-tenant.
+        expected = {metadata["issuer"].replace("{tenantid}", str(claims.get("tid", "")))} | self.issuers
+        if claims["iss"] not in expected:
+            raise jwt.InvalidIssuerError("Invalid issuer")
+        return claims
+
+
+async def post_form(url: str, data: dict):
+    """POST application/x-www-form-urlencoded sin bloquear el event loop. Devuelve (status, json)."""
+    timeout = aiohttp.ClientTimeout(total=jwks_fetch_timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(url, data=data) as response:
+            return response.status, await response.json(content_type=None)
+
+
+async def decode_verified(token: str, key_cache: PublicKeyCache, audience, issuer, algorithms=("RS256",)):
+    """Valida firma, `aud`, `iss` y fechas de un JWT firmado por un proveedor externo.
+
+    Con `issuer=None` solo se exige que `iss` exista; la comparación queda a cargo
+    del llamador. Lanza `jwt.PyJWTError` si el token no es válido.
+    """
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") not in algorithms:
+        raise jwt.InvalidAlgorithmError("Unexpected token algorithm")
+    key = await key_cache.get_key(header.get("kid"))
+    if key is None:
+        raise jwt.InvalidKeyError("Unknown signing key")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=list(algorithms),
+        audience=audience,
+        issuer=issuer,
+        leeway=jwt_leeway_seconds,
+        options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+    )
@@ -0,0 +1,219 @@
+import io
+import os
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import marshal
+import threading
+
+from collections import Counter, OrderedDict
+
+from dotenv import load_dotenv
+
+from utils.security import SECRET_KEY_FUNC
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Perfiles de petición que se conservan para descarga.
+profile_history_size = int(os.getenv("PROFILE_HISTORY_SIZE", "20"))
+# Intervalo por defecto del muestreador continuo y máximo de pilas distintas.
+sampler_interval_ms = float(os.getenv("SAMPLER_INTERVAL_MS", "10"))
+sampler_max_stacks = int(os.getenv("SAMPLER_MAX_STACKS", "20000"))
+
+profiles = OrderedDict()
+_profile_lock = threading.Lock()
+
+
+def is_profile_key(value) -> bool:
+    return bool(SECRET_KEY_FUNC) and value is not None and hmac.compare_digest(value, SECRET_KEY_FUNC)
+
+
+def _store_profile(profile_id: str, profiler: cProfile.Profile, method: str, path: str, duration: float):
+    profiler.create_stats()
+    profiles[profile_id] = {
+        "id": profile_id,
+        "method": method,
+        "path": path,
+        "duration_ms": round(duration * 1000, 2),
+        "created_at": time.time(),
+        "stats": profiler.stats,
+    }
+    while len(profiles) > profile_history_size:
+        profiles.popitem(last=False)
+
+
+def list_profiles():
+    return [
+        {key: value for key, value in profile.items() if key != "stats"}
+        for profile in reversed(profiles.values())
+    ]
+
+
+def profile_as_text(profile_id: str, sort: str = "cumulative", limit: int = 60):
+    profile = profiles.get(profile_id)
+    if profile is None:
+        return None
+    output = io.StringIO()
+    stats = pstats.Stats(_StatsHolder(profile["stats"]), stream=output)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def profile_as_pstats(profile_id: str):
+    """Formato binario de pstats (compatible con snakeviz, flameprof, gprof2dot)."""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        return None
+    return marshal.dumps(profile["stats"])
+
+
+class _StatsHolder:
+    # pstats.Stats acepta cualquier objeto con create_stats()/stats.
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfilingMiddleware:
+    """Perfila con cProfile la petición que lleva `X-Profile-Key` con la clave de función.
+
+    cProfile mide el hilo del event loop mientras dura la petición, así que
+    también incluye el trabajo de otras peticiones concurrentes. Solo se
+    perfila una petición a la vez; las demás se sirven sin perfilar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-key":
+                key = value.decode("latin-1")
+                break
+        if key is None or not is_profile_key(key):
+            await self.app(scope, receive, send)
+            return
+
+        if not _profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                profiler.disable()
+            _store_profile(profile_id, profiler, scope["method"], scope["path"], time.perf_counter() - start)
+        finally:
+            _profile_lock.release()
+
+
+class StackSampler:
+    """Muestreador de pilas de bajo coste que se activa y desactiva en caliente.
+
+    Un hilo toma `sys._current_frames()` cada `interval` y acumula las pilas
+    en formato "collapsed" (`a;b;c N`), el que usan flamegraph.pl y speedscope.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.interval = sampler_interval_ms / 1000
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = None, thread_id: int = None):
+        if self.running:
+            return False
+        if interval_ms:
+            self.interval = interval_ms / 1000
+        # Por defecto solo se muestrea el hilo principal (el del event loop).
+        self._target = thread_id or threading.main_thread().ident
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.samples = 0
+            self.dropped = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None or self._target == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            with self._lock:
+                self.samples += 1
+                if key in self.counts or len(self.counts) < sampler_max_stacks:
+                    self.counts[key] += 1
+                else:
+                    self.dropped += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common()) + "\n"
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval_ms": self.interval * 1000,
+                "started_at": self.started_at,
+                "samples": self.samples,
+                "distinct_stacks": len(self.counts),
+                "dropped": self.dropped,
+            }
+
+
+sampler = StackSampler()
@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import logging
+import threading
+
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Consultas que tarden más que esto (ms) se registran como lentas.
+slow_query_ms = float(os.getenv("SQL_SLOW_QUERY_MS", "500"))
+# Máximo de huellas distintas que se conservan.
+query_stats_max_fingerprints = int(os.getenv("SQL_STATS_MAX_FINGERPRINTS", "500"))
+# Longitud máxima del texto de ejemplo guardado por huella.
+query_sample_length = int(os.getenv("SQL_STATS_SAMPLE_LENGTH", "500"))
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w@#\]])[-+]?(?:0x[0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\b")
+_PLACEHOLDERS = re.compile(r"%[sd]|%\(\w+\)[sd]")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_query(query: str) -> str:
+    """Normaliza literales para agrupar consultas iguales con valores distintos.
+
+    `EXEC commette.get_product_by_id @ProductID = 17` y `... = 18` producen la misma huella.
+    """
+    text = _COMMENTS.sub(" ", query)
+    text = _STRINGS.sub("?", text)
+    text = _PLACEHOLDERS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _VALUES_LISTS.sub("(?)+", text)
+    text = _IN_LISTS.sub("(?+)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class QueryStats:
+    """Contadores acumulados por huella de consulta, con tamaño acotado.
+
+    Al llenarse se descarta la huella con menor tiempo total, para que las
+    consultas costosas nunca salgan del ranking.
+    """
+
+    def __init__(self, max_fingerprints: int):
+        self.max_fingerprints = max_fingerprints
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.since = time.time()
+
+    def record(self, query: str, duration_ms: float, rows: int = 0, size: int = 0,
+               error: bool = False, pool: str = None, params=None):
+        fingerprint = fingerprint_query(query)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    victim = min(self._entries, key=lambda k: self._entries[k]["total_ms"])
+                    del self._entries[victim]
+                    self.evicted += 1
+                entry = self._entries[fingerprint] = {
+                    "fingerprint": fingerprint,
+                    "sample": query[:query_sample_length],
+                    "calls": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                    "slow_calls": 0,
+                    "last_seen": 0.0,
+                }
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["rows"] += rows
+            entry["bytes"] += size
+            entry["last_seen"] = time.time()
+            slow = duration_ms >= slow_query_ms
+            if slow:
+                entry["slow_calls"] += 1
+
+        if slow:
+            # Texto completo y parámetros: son los que determinan el plan (parameter sniffing).
+            logger.warning(
+                f"Slow query ({duration_ms:.1f} ms, rows={rows}, bytes={size}, pool={pool}, error={error}): "
+                f"{_WHITESPACE.sub(' ', query).strip()} params={params!r}"
+            )
+        else:
+            logger.debug(f"Query {duration_ms:.1f} ms rows={rows}: {fingerprint}")
+
+    def top(self, limit: int = 20, sort: str = "total_ms"):
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        for entry in entries:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["calls"], 3) if entry["calls"] else 0.0
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+        return {
+            "since": self.since,
+            "fingerprints": len(self._entries),
+            "evicted": self.evicted,
+            "slow_query_ms": slow_query_ms,
+            "queries": entries[:limit],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.evicted = 0
+            self.since = time.time()
+
+
+query_stats = QueryStats(query_stats_max_fingerprints)
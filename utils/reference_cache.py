@@ -0,0 +1,69 @@
+import os
+import time
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Segundos tras los que una entrada se vuelve a leer de la base de datos (en segundo plano).
+reference_cache_ttl = float(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "300"))
+
+
+class ReferenceCache:
+    """Datos de referencia (categorías, marcas) con stale-while-revalidate.
+
+    Una entrada caducada se sigue sirviendo mientras se recarga en segundo
+    plano; solo la primera lectura espera a la base de datos.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries = {}
+        self._tasks = {}
+
+    def put(self, name: str, value, loaded_at: float = None):
+        self.entries[name] = (loaded_at or time.time(), value)
+
+    def _load(self, name: str, loader):
+        # Una sola carga por nombre aunque lleguen varias peticiones a la vez.
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            async def load():
+                self.put(name, await loader())
+                return self.entries[name][1]
+            task = self._tasks[name] = asyncio.create_task(load())
+        return task
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background reference refresh failed: {task.exception()}")
+
+    async def get(self, name: str, loader):
+        entry = self.entries.get(name)
+        if entry is None:
+            return await self._load(name, loader)
+        loaded_at, value = entry
+        if time.time() - loaded_at > self.ttl:
+            self._load(name, loader).add_done_callback(self._log_failure)
+        return value
+
+    def invalidate(self, name: str = None):
+        if name is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(name, None)
+
+    def dump(self):
+        return {name: {"loaded_at": loaded_at, "value": value} for name, (loaded_at, value) in self.entries.items()}
+
+    def restore(self, data: dict):
+        for name, entry in data.items():
+            self.put(name, entry["value"], entry["loaded_at"])
+
+
+reference_cache = ReferenceCache(reference_cache_ttl)
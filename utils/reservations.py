@@ -0,0 +1,163 @@
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class ReservationNotFound(Exception):
+    pass
+
+
+class StockCounter:
+    """Contador de stock de un producto.
+
+    `stock` es el último valor conocido en SQL Server. Lo reservado y lo que
+    se está confirmando (aún sin escribir) se descuentan en memoria.
+    """
+
+    __slots__ = ("stock", "reserved", "confirming", "last_used")
+
+    def __init__(self, stock: int):
+        self.stock = stock
+        self.reserved = 0
+        self.confirming = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def available(self) -> int:
+        return self.stock - self.reserved - self.confirming
+
+    @property
+    def held(self) -> int:
+        # Unidades comprometidas en memoria que SQL Server aún no descuenta.
+        return self.reserved + self.confirming
+
+    @property
+    def idle(self) -> bool:
+        return self.reserved == 0 and self.confirming == 0
+
+
+class ReservationEngine:
+    """Reservas de stock en memoria; las confirmaciones se escriben en SQL Server.
+
+    Todas las operaciones son síncronas y se ejecutan en el event loop, por lo
+    que cada una es atómica respecto a las demás: no hay sobreventa dentro del
+    proceso. Una confirmación retiene sus unidades (`begin_confirm`) hasta que
+    SQL Server la aplica o la rechaza (`confirm_finished`).
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.counters = {}
+        self.reservations = {}
+
+    def is_loaded(self, product_id: int) -> bool:
+        return product_id in self.counters
+
+    def load(self, product_id: int, stock: int):
+        if product_id not in self.counters:
+            self.counters[product_id] = StockCounter(stock)
+
+    def set_stock(self, product_id: int, stock: int):
+        """Actualiza el valor conocido en SQL (p. ej. tras un PUT o PATCH de stock)."""
+        counter = self.counters.get(product_id)
+        if counter is not None:
+            counter.stock = stock
+
+    def held(self, product_id: int) -> int:
+        counter = self.counters.get(product_id)
+        return counter.held if counter is not None else 0
+
+    def reserve(self, product_id: int, quantity: int, id_user: int = None):
+        counter = self.counters[product_id]
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        if counter.available < quantity:
+            raise InsufficientStock(product_id)
+
+        counter.reserved += quantity
+        counter.last_used = time.monotonic()
+        reservation = {
+            "id": uuid.uuid4().hex,
+            "id_product": product_id,
+            "quantity": quantity,
+            "id_user": id_user,
+            "expires_at": time.time() + self.ttl_seconds,
+            "status": "reserved",
+        }
+        self.reservations[reservation["id"]] = reservation
+        return reservation
+
+    def get(self, reservation_id: str):
+        reservation = self.reservations.get(reservation_id)
+        if reservation is None:
+            raise ReservationNotFound(reservation_id)
+        return reservation
+
+    def begin_confirm(self, reservation_id: str):
+        """Pasa la reserva a `confirming`; sus unidades siguen retenidas hasta `confirm_finished`."""
+        reservation = self.reservations.pop(reservation_id, None)
+        if reservation is None:
+            raise ReservationNotFound(reservation_id)
+
+        counter = self.counters[reservation["id_product"]]
+        counter.reserved -= reservation["quantity"]
+        if counter.stock - counter.confirming < reservation["quantity"]:
+            # El stock conocido bajó después de reservar (p. ej. otro worker vendió antes).
+            reservation["status"] = "released"
+            raise InsufficientStock(reservation["id_product"])
+        counter.confirming += reservation["quantity"]
+        counter.last_used = time.monotonic()
+        reservation["status"] = "confirming"
+        return reservation
+
+    def confirm_finished(self, reservation: dict, held: bool, applied: bool, stock: int = None):
+        """Cierra una confirmación.
+
+        `held` indica si las unidades estaban retenidas en este proceso. El stock
+        conocido se ajusta con el delta aplicado, no con el valor leído en la
+        escritura: un PUT o PATCH posterior ya puede haberlo cambiado.
+        """
+        counter = self.counters.get(reservation["id_product"])
+        if counter is None:
+            return
+        if held:
+            counter.confirming -= reservation["quantity"]
+        if applied:
+            counter.stock -= reservation["quantity"]
+        elif stock is not None:
+            # SQL tiene menos stock del que se creía: nunca se sube el valor conocido.
+            counter.stock = min(counter.stock, stock)
+
+    def release(self, reservation_id: str):
+        reservation = self.reservations.pop(reservation_id, None)
+        if reservation is None:
+            raise ReservationNotFound(reservation_id)
+        self.counters[reservation["id_product"]].reserved -= reservation["quantity"]
+        reservation["status"] = "released"
+        return reservation
+
+    def expire(self, now: float = None):
+        now = now or time.time()
+        expired = [r_id for r_id, r in self.reservations.items() if r["expires_at"] <= now]
+        for reservation_id in expired:
+            self.release(reservation_id)
+        return len(expired)
+
+    def evict_idle(self, idle_seconds: float):
+        # Los contadores sin movimiento se descartan para volver a leer el stock de SQL.
+        limit = time.monotonic() - idle_seconds
+        for product_id in [p for p, c in self.counters.items() if c.idle and c.last_used < limit]:
+            del self.counters[product_id]
+
+    def stats(self):
+        return {
+            "products": len(self.counters),
+            "active_reservations": len(self.reservations),
+            "confirming_units": sum(c.confirming for c in self.counters.values()),
+        }
@@ -0,0 +1,228 @@
+import re
+import math
+import bisect
+import logging
+import unicodedata
+
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Campos indexados y su peso en el ranking.
+TEXT_FIELDS = {
+    "product_name": 3.0,
+    "product_description": 1.0,
+}
+# Campos (en orden de preferencia) de los que se toma cada faceta.
+FACET_FIELDS = {
+    "category": ("category_name", "id_category"),
+    "brand": ("brand_name", "id_brand"),
+}
+ID_FIELD = "id_product"
+PRICE_FIELD = "price"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text) -> str:
+    # Minúsculas y sin tildes para que "camión" y "camion" coincidan.
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_RE.findall(normalize(text))
+
+
+def facet_values(doc: dict, facet: str):
+    """Valores con los que un filtro de faceta puede coincidir (nombre e id)."""
+    return {normalize(doc[f]) for f in FACET_FIELDS[facet] if doc.get(f) is not None}
+
+
+def facet_label(doc: dict, facet: str):
+    for field in FACET_FIELDS[facet]:
+        if doc.get(field) is not None:
+            return doc[field]
+    return None
+
+
+class ProductSearchIndex:
+    """Índice invertido en memoria sobre el catálogo de productos.
+
+    Se construye completo con `rebuild` y se mantiene con `upsert`/`remove`
+    cuando se crean, actualizan o eliminan productos.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.ready = False
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._vocabulary = []
+
+    def rebuild(self, rows):
+        index = ProductSearchIndex()
+        for row in rows:
+            index._add(row)
+        index._vocabulary = sorted(index._postings)
+        # Se reemplaza el estado de una vez para que las búsquedas nunca vean un índice a medias.
+        self.__dict__.update(index.__dict__)
+        self.ready = True
+        logger.info(f"Índice de búsqueda construido con {len(self.docs)} productos")
+
+    def upsert(self, row: dict):
+        doc_id = row.get(ID_FIELD)
+        if doc_id is None:
+            return
+        merged = {**self.docs.get(doc_id, {}), **row}
+        self._remove(doc_id)
+        self._add(merged)
+
+    def remove(self, doc_id):
+        self._remove(doc_id)
+
+    def _add(self, row: dict):
+        doc_id = row.get(ID_FIELD)
+        if doc_id is None:
+            return
+
+        frequencies = defaultdict(float)
+        length = 0.0
+        for field, weight in TEXT_FIELDS.items():
+            tokens = tokenize(row.get(field))
+            length += weight * len(tokens)
+            for token in tokens:
+                frequencies[token] += weight
+
+        for term, frequency in frequencies.items():
+            if term not in self._postings and self.ready:
+                bisect.insort(self._vocabulary, term)
+            self._postings[term][doc_id] = frequency
+
+        self.docs[doc_id] = row
+        self._doc_terms[doc_id] = set(frequencies)
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def _remove(self, doc_id):
+        if doc_id not in self.docs:
+            return
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                position = bisect.bisect_left(self._vocabulary, term)
+                if position < len(self._vocabulary) and self._vocabulary[position] == term:
+                    self._vocabulary.pop(position)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        del self.docs[doc_id]
+
+    def _expand_prefix(self, prefix: str):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _score(self, terms):
+        """Puntuación BM25 simplificada; exige que el documento contenga todos los términos."""
+        if not terms:
+            return {doc_id: 0.0 for doc_id in self.docs}
+
+        total = len(self.docs) or 1
+        average_length = (self._total_length / total) or 1.0
+        k1, b = 1.2, 0.75
+
+        scores = None
+        for position, term in enumerate(terms):
+            # El último término se trata como prefijo para búsquedas mientras se escribe.
+            if position == len(terms) - 1:
+                variants = self._expand_prefix(term)
+            else:
+                variants = [term] if term in self._postings else []
+
+            term_scores = {}
+            for variant in variants:
+                postings = self._postings[variant]
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = k1 * (1 - b + b * self._doc_lengths[doc_id] / average_length)
+                    score = idf * frequency * (k1 + 1) / (frequency + norm)
+                    term_scores[doc_id] = max(term_scores.get(doc_id, 0.0), score)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, q=None, category=None, brand=None, min_price=None, max_price=None,
+               page: int = 1, page_size: int = 20):
+        scores = self._score(tokenize(q))
+        filters = {
+            "category": normalize(category) if category not in (None, "") else None,
+            "brand": normalize(brand) if brand not in (None, "") else None,
+        }
+
+        def in_price(doc):
+            price = doc.get(PRICE_FIELD)
+            if price is None:
+                return min_price is None and max_price is None
+            if min_price is not None and price < min_price:
+                return False
+            if max_price is not None and price > max_price:
+                return False
+            return True
+
+        def passes(doc, skip=None):
+            for facet, value in filters.items():
+                if facet != skip and value is not None and value not in facet_values(doc, facet):
+                    return False
+            return True
+
+        candidates = [doc_id for doc_id in scores if in_price(self.docs[doc_id])]
+
+        # Facetas disyuntivas: cada una se cuenta ignorando su propio filtro.
+        facets = {}
+        for facet in FACET_FIELDS:
+            counts = defaultdict(int)
+            for doc_id in candidates:
+                doc = self.docs[doc_id]
+                if passes(doc, skip=facet):
+                    label = facet_label(doc, facet)
+                    if label is not None:
+                        counts[label] += 1
+            facets[facet] = [
+                {"value": value, "count": count}
+                for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+            ]
+
+        matches = [doc_id for doc_id in candidates if passes(self.docs[doc_id])]
+        matches.sort(key=lambda doc_id: (-scores[doc_id], -doc_id if isinstance(doc_id, int) else 0))
+
+        start = (page - 1) * page_size
+        items = []
+        for doc_id in matches[start:start + page_size]:
+            item = dict(self.docs[doc_id])
+            item["score"] = round(scores[doc_id], 4)
+            items.append(item)
+
+        return {
+            "total": len(matches),
+            "page": page,
+            "page_size": page_size,
+            "items": items,
+            "facets": facets,
+        }
+
+
+product_index = ProductSearchIndex()
@@ -3,6 +3,7 @@ import os
 import secrets  
 import hashlib  
 import base64  
+import hmac  
 import jwt  
 
 from datetime import datetime, timedelta  # Importa clases para manejo de fechas y tiempos.
@@ -10,6 +11,9 @@ from fastapi import HTTPException  # Importa clase para manejar excepciones HTTP
 from dotenv import load_dotenv  # Importa función para cargar variables de entorno desde un archivo .env.
 from jwt import PyJWTError  # Importa clase para manejar errores específicos de JWT.
 from functools import wraps  # Importa decorador para funciones.
+from starlette.datastructures import Headers  # Importa el acceso a encabezados desde el scope ASGI.
+from starlette.responses import JSONResponse  # Importa la respuesta JSON para los rechazos del middleware.
+from starlette.routing import Match  # Importa el resultado de comparar una ruta con la petición.
 
 # Carga las variables de entorno desde el archivo .env.
 load_dotenv()  
@@ -17,6 +21,10 @@ load_dotenv()
 # Obtiene la clave secreta desde las variables de entorno.
 SECRET_KEY = os.getenv("SECRET_KEY")  
 SECRET_KEY_FUNC = os.getenv("SECRET_KEY_FUNC")
+# Rol con acceso a los datos de todos los vendedores.
+ADMIN_ROLE = os.getenv("ADMIN_ROLE", "admin")
+# Tamaño máximo del cuerpo de las peticiones (bytes); las rutas pueden fijar otro con max_body_size.
+MAX_BODY_SIZE = int(os.getenv("MAX_BODY_SIZE", str(1024 * 1024)))
 
 # Define una función para generar un PKCE verifier utilizando tokens seguros.
 def generate_pkce_verifier():  
@@ -49,6 +57,86 @@ def create_jwt_token(id_user: int, firstname: str, lastname: str, email: str, ro
     )
     return token
 
+# Indica si el usuario autenticado en la petición es administrador.
+def is_admin(request) -> bool:
+    return getattr(request.state, "role", None) == ADMIN_ROLE
+
+# Extrae el token de un encabezado `Authorization: Bearer <token>`.
+def _bearer_token(authorization: str):
+    if not authorization:
+        raise HTTPException(status_code=400, detail="Authorization header missing")
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        raise HTTPException(status_code=400, detail="Invalid authentication scheme")
+    return parts[1]
+
+# Valida nuestro JWT de sesión y devuelve los datos del usuario que se inyectan en la petición.
+def decode_session_token(authorization: str) -> dict:
+    token = _bearer_token(authorization)
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token or expired token")
+
+    id_user = payload.get("id_user")
+    email = payload.get("email")
+    expired = payload.get("exp")
+    active = payload.get("active")
+    role = payload.get("role")
+
+    if id_user is None or email is None or expired is None or active is None or role is None:
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    if datetime.utcfromtimestamp(expired) < datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Expired token")
+
+    if not active:
+        raise HTTPException(status_code=403, detail="Inactive user")
+
+    return {
+        "id_user": id_user,
+        "email": email,
+        "firstname": payload.get("firstname"),
+        "lastname": payload.get("lastname"),
+        "role": role,
+    }
+
+# Igual que decode_session_token pero admite usuarios inactivos; solo devuelve el email.
+def decode_inactive_token(authorization: str) -> dict:
+    try:
+        token = _bearer_token(authorization)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except PyJWTError:
+        raise HTTPException(status_code=403, detail="Invalid token or expired token")
+
+    email = payload.get("email")
+    expired = payload.get("exp")
+
+    if email is None or expired is None:
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    if datetime.utcfromtimestamp(expired) < datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Expired token")
+
+    return {"email": email}
+
+# Comprueba la clave de función de las rutas internas.
+def check_function_key(authorization: str) -> dict:
+    if not authorization:
+        raise HTTPException(status_code=403, detail="Authorization header missing")
+
+    if not SECRET_KEY_FUNC or not hmac.compare_digest(authorization, SECRET_KEY_FUNC):
+        raise HTTPException(status_code=403, detail="Wrong function key")
+
+    return {}
+
+# Tipo de autenticación de cada decorador; AuthMiddleware lo lee del endpoint (`__auth__`).
+AUTH_CHECKS = {
+    "session": decode_session_token,
+    "inactive": decode_inactive_token,
+    "function": check_function_key,
+}
+
 # Define un decorador para validar un JWT en las peticiones.
 def validate(func):
     @wraps(func)
@@ -57,44 +145,17 @@ def validate(func):
         if not request:
             raise HTTPException(status_code=400, detail="Request object not found")
 
-        authorization: str = request.headers.get("Authorization")
-        if not authorization:
-            raise HTTPException(status_code=400, detail="Authorization header missing")
-
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(status_code=400, detail="Invalid authentication scheme")
+        # Token ya validado por AuthMiddleware o subpetición interna (p. ej. /batch).
+        if getattr(request.state, "authenticated", False):
+            return await func(*args, **kwargs)
 
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-
-            id_user = payload.get("id_user")
-            email = payload.get("email")
-            expired = payload.get("exp")
-            active = payload.get("active")
-            firstname = payload.get("firstname")
-            lastname = payload.get("lastname")
-            role = payload.get("role")
-
-            if id_user is None or email is None or expired is None or active is None or role is None:
-                raise HTTPException(status_code=400, detail="Invalid token")
-
-            if datetime.utcfromtimestamp(expired) < datetime.utcnow():
-                raise HTTPException(status_code=401, detail="Expired token")
-
-            if not active:
-                raise HTTPException(status_code=403, detail="Inactive user")
-
-            # Inyectar los valores en el objeto request
-            request.state.id_user = id_user
-            request.state.email = email
-            request.state.firstname = firstname
-            request.state.lastname = lastname
-            request.state.role = role
-        except PyJWTError:
-            raise HTTPException(status_code=401, detail="Invalid token or expired token")
+        # Inyectar los valores en el objeto request
+        claims = decode_session_token(request.headers.get("Authorization"))
+        for key, value in claims.items():
+            setattr(request.state, key, value)
 
         return await func(*args, **kwargs)
+    wrapper.__auth__ = "session"
     return wrapper
 
 
@@ -105,34 +166,11 @@ def validate_for_inactive(func):
         if not request:
             raise HTTPException(status_code=400, detail="Request object not found")
 
-        authorization: str = request.headers.get("Authorization")
-        if not authorization:
-            raise HTTPException(status_code=400, detail="Authorization header missing")
-
-        try:
-            scheme, token = authorization.split()
-            if scheme.lower() != "bearer":
-                raise HTTPException(status_code=400, detail="Invalid authentication scheme")
-
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-
-            email = payload.get("email")
-            expired = payload.get("exp")
-
-            if email is None or expired is None:
-                raise HTTPException(status_code=400, detail="Invalid token")
-
-            if datetime.utcfromtimestamp(expired) < datetime.utcnow():
-                raise HTTPException(status_code=401, detail="Expired token")
-
-
-
-            # Inyectar el email en el objeto request
-            request.state.email = email
-        except PyJWTError:
-            raise HTTPException(status_code=403, detail="Invalid token or expired token")
+        # Inyectar el email en el objeto request
+        request.state.email = decode_inactive_token(request.headers.get("Authorization"))["email"]
 
         return await func(*args, **kwargs)
+    wrapper.__auth__ = "inactive"
     return wrapper
 
 def validate_func(func):
@@ -142,12 +180,83 @@ def validate_func(func):
         if not request:
             raise HTTPException(status_code=400, detail="Request object not found")
 
-        authorization: str = request.headers.get("Authorization")
-        if not authorization:
-            raise HTTPException(status_code=403, detail="Authorization header missing")
-
-        if authorization != SECRET_KEY_FUNC:
-            raise HTTPException(status_code=403, detail="Wrong function key")
+        check_function_key(request.headers.get("Authorization"))
 
         return await func(*args, **kwargs)
-    return wrapper
\ No newline at end of file
+    wrapper.__auth__ = "function"
+    return wrapper
+
+# Define un decorador que fija el tamaño máximo del cuerpo de una ruta (por defecto MAX_BODY_SIZE).
+def max_body_size(limit: int):
+    def decorator(func):
+        func.__max_body_size__ = limit
+        return func
+    return decorator
+
+
+class AuthMiddleware:
+    """Autentica en la capa ASGI, antes de leer y validar el cuerpo de la petición.
+
+    La ruta se resuelve con `route.matches()` sobre las rutas de la aplicación y
+    el tipo de autenticación sale del decorador del endpoint (`__auth__`). Las
+    peticiones sin token válido se rechazan sin leer el cuerpo; las válidas
+    llegan con los datos del usuario en `request.state`. También limita el
+    tamaño del cuerpo (Content-Length y bytes realmente recibidos).
+    """
+
+    def __init__(self, app, max_body: int = None):
+        self.app = app
+        self.max_body = max_body if max_body is not None else MAX_BODY_SIZE
+        self._routes = None
+
+    def _resolve(self, scope):
+        if self._routes is None:
+            self._routes = [
+                (
+                    route,
+                    getattr(getattr(route, "endpoint", None), "__auth__", None),
+                    getattr(getattr(route, "endpoint", None), "__max_body_size__", self.max_body),
+                )
+                for route in scope["app"].router.routes
+            ]
+        for route, auth, limit in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return auth, limit
+        return None, self.max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        auth, limit = self._resolve(scope)
+        headers = Headers(scope=scope)
+        try:
+            if auth is not None:
+                claims = AUTH_CHECKS[auth](headers.get("authorization"))
+                state = scope.setdefault("state", {})
+                state.update(claims)
+                if auth == "session":
+                    state["authenticated"] = True
+
+            content_length = headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > limit:
+                raise HTTPException(status_code=413, detail="Request body too large")
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Stock a partir del cual (inclusive) un producto cuenta como "stock bajo".
+low_stock_threshold = int(os.getenv("SELLER_LOW_STOCK_THRESHOLD", "5"))
+# Productos con stock bajo que se devuelven como máximo.
+low_stock_list_limit = int(os.getenv("SELLER_LOW_STOCK_LIST_LIMIT", "50"))
+
+# Campos (en orden de preferencia) de los que se toma el vendedor de cada producto.
+SELLER_FIELDS = ("id_user", "id_seller")
+
+
+def _seller_of(row: dict):
+    for field in SELLER_FIELDS:
+        if row.get(field) is not None:
+            return row[field]
+    return None
+
+
+class _Totals:
+    __slots__ = ("products", "total_stock", "stock_value", "out_of_stock", "low_stock")
+
+    def __init__(self):
+        self.products = 0
+        self.total_stock = 0
+        self.stock_value = 0.0
+        self.out_of_stock = 0
+        self.low_stock = {}
+
+
+class SellerStats:
+    """Agregados por vendedor mantenidos de forma incremental.
+
+    Guarda lo último conocido de cada producto (vendedor, stock, precio) para
+    aplicar solo la diferencia en cada cambio. `rebuild` los recalcula desde
+    cero y corrige cualquier desviación acumulada.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.sellers = {}
+        self.ready = False
+        self.rebuilt_at = None
+
+    def rebuild(self, rows):
+        stats = SellerStats()
+        for row in rows:
+            product_id = row.get("id_product")
+            seller = _seller_of(row)
+            if product_id is None or seller is None:
+                continue
+            stats._apply(product_id, (seller, row.get("stock") or 0, row.get("price") or 0.0, row.get("product_name")))
+        # Se reemplaza el estado de una vez, igual que el índice de búsqueda.
+        self.products = stats.products
+        self.sellers = stats.sellers
+        self.ready = True
+        self.rebuilt_at = time.time()
+        logger.info(f"Seller stats rebuilt for {len(self.sellers)} sellers")
+
+    def _apply(self, product_id, entry):
+        old = self.products.pop(product_id, None)
+        if old is not None:
+            self._add(product_id, old, -1)
+        if entry is not None:
+            self.products[product_id] = entry
+            self._add(product_id, entry, 1)
+
+    def _add(self, product_id, entry, sign: int):
+        seller, stock, price, name = entry
+        totals = self.sellers.get(seller)
+        if totals is None:
+            totals = self.sellers[seller] = _Totals()
+        totals.products += sign
+        totals.total_stock += sign * stock
+        totals.stock_value += sign * stock * float(price)
+        if stock <= 0:
+            totals.out_of_stock += sign
+        if stock <= low_stock_threshold:
+            if sign > 0:
+                totals.low_stock[product_id] = (stock, name)
+            else:
+                totals.low_stock.pop(product_id, None)
+        if totals.products == 0:
+            del self.sellers[seller]
+
+    def upsert(self, product_id, seller=None, stock=None, price=None, name=None):
+        """Aplica un cambio parcial; los campos en None conservan el valor conocido.
+
+        Devuelve False si el producto no se conoce y faltan datos para agregarlo.
+        """
+        old = self.products.get(product_id)
+        if old is None and (seller is None or stock is None or price is None):
+            return False
+        old = old or (None, 0, 0.0, None)
+        self._apply(product_id, (
+            seller if seller is not None else old[0],
+            stock if stock is not None else old[1],
+            price if price is not None else old[2],
+            name if name is not None else old[3],
+        ))
+        return True
+
+    def upsert_row(self, row: dict):
+        # Misma lectura de campos que `rebuild`, para filas completas de product_info.
+        if row.get("id_product") is None:
+            return False
+        return self.upsert(
+            row.get("id_product"), _seller_of(row), row.get("stock") or 0,
+            row.get("price") or 0.0, row.get("product_name"),
+        )
+
+    def set_stock(self, product_id, stock: int):
+        return self.upsert(product_id, stock=stock)
+
+    def remove(self, product_id):
+        self._apply(product_id, None)
+
+    def stats(self, seller):
+        totals = self.sellers.get(seller) or _Totals()
+        low_stock = sorted(totals.low_stock.items(), key=lambda item: (item[1][0], item[0]))
+        return {
+            "id_seller": seller,
+            "products": totals.products,
+            "total_stock": totals.total_stock,
+            "stock_value": round(totals.stock_value, 2),
+            "out_of_stock": totals.out_of_stock,
+            "low_stock_threshold": low_stock_threshold,
+            "low_stock_count": len(low_stock),
+            "low_stock": [
+                {"id_product": product_id, "product_name": name, "stock": stock}
+                for product_id, (stock, name) in low_stock[:low_stock_list_limit]
+            ],
+            "rebuilt_at": self.rebuilt_at,
+        }
+
+
+seller_stats = SellerStats()
@@ -0,0 +1,85 @@
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Formato del archivo (little-endian):
+#   cabecera   MAGIC, versión, nº de secciones, fecha de creación
+#   tabla      por sección: nombre (16 bytes), offset, longitud
+#   datos      cada sección en JSON compacto
+#   pie        blake2b (32 bytes) de todo lo anterior
+MAGIC = b"CMTSNAP\0"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<8sHHd")
+_ENTRY = struct.Struct("<16sQQ")
+_DIGEST_SIZE = 32
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest()
+
+
+def write_snapshot(path: str, sections: dict):
+    """Escribe las secciones y reemplaza el archivo de forma atómica."""
+    payloads = [
+        (name.encode()[:16], json.dumps(value, default=str, separators=(",", ":")).encode("utf-8"))
+        for name, value in sections.items()
+    ]
+    offset = _HEADER.size + _ENTRY.size * len(payloads)
+    table = []
+    for name, payload in payloads:
+        table.append(_ENTRY.pack(name, offset, len(payload)))
+        offset += len(payload)
+
+    body = b"".join(
+        [_HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(payloads), time.time())]
+        + table
+        + [payload for _, payload in payloads]
+    )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+        f.write(_digest(body))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(body) + _DIGEST_SIZE
+
+
+def read_snapshot(path: str):
+    """Devuelve `(created_at, secciones)`. Lanza SnapshotError si el archivo no es válido."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size + _DIGEST_SIZE:
+            raise SnapshotError("Snapshot file too small")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                if _digest(view[:-_DIGEST_SIZE]) != bytes(view[-_DIGEST_SIZE:]):
+                    raise SnapshotError("Snapshot checksum mismatch")
+                magic, version, count, created_at = _HEADER.unpack_from(mm, 0)
+                if magic != MAGIC:
+                    raise SnapshotError("Not a snapshot file")
+                if version != SNAPSHOT_VERSION:
+                    raise SnapshotError(f"Unsupported snapshot version {version}")
+
+                sections = {}
+                for i in range(count):
+                    name, offset, length = _ENTRY.unpack_from(mm, _HEADER.size + i * _ENTRY.size)
+                    if offset + length > size - _DIGEST_SIZE:
+                        raise SnapshotError("Snapshot section out of bounds")
+                    sections[name.rstrip(b"\0").decode()] = json.loads(view[offset:offset + length].tobytes())
+            finally:
+                view.release()
+    return created_at, sections
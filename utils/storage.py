@@ -0,0 +1,177 @@
+import os
+import uuid
+import base64
+import logging
+
+from urllib.parse import unquote, urlsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "azure" usa Blob Storage; "local" guarda los archivos en disco (desarrollo y pruebas).
+blob_backend = os.getenv("BLOB_BACKEND", "azure")
+blob_connection_string = os.getenv("AZURE_BLOB_CONNECTION_STRING") or os.getenv("AZURE_SAK")
+blob_container = os.getenv("BLOB_CONTAINER", "product-images")
+local_blob_root = os.getenv("LOCAL_BLOB_ROOT", "media")
+local_blob_base_url = os.getenv("LOCAL_BLOB_BASE_URL", "/media")
+# Hosts de imágenes externas aceptados en `product_image`, además del de Blob Storage.
+extra_image_hosts = os.getenv("PRODUCT_IMAGE_HOSTS", "")
+
+
+def _blob_host(connection_string: str):
+    """Host del endpoint de blobs a partir de la cadena de conexión de Azure Storage."""
+    settings = dict(
+        part.split("=", 1) for part in (connection_string or "").split(";") if "=" in part
+    )
+    if settings.get("BlobEndpoint"):
+        return urlsplit(settings["BlobEndpoint"]).hostname
+    if settings.get("AccountName"):
+        return f"{settings['AccountName']}.blob.{settings.get('EndpointSuffix', 'core.windows.net')}"
+    return None
+
+
+image_hosts = {host.strip().lower() for host in extra_image_hosts.split(",") if host.strip()}
+if blob_backend != "local" and _blob_host(blob_connection_string):
+    image_hosts.add(_blob_host(blob_connection_string).lower())
+
+
+class LocalBlobUpload:
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class LocalBlobBackend:
+    """Sustituto de Blob Storage sobre el sistema de archivos local."""
+
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid blob name: {name}")
+        return path
+
+    def begin_upload(self, name: str, content_type: str):
+        return LocalBlobUpload(self._path(name))
+
+    def put(self, name: str, data: bytes, content_type: str):
+        upload = self.begin_upload(name, content_type)
+        upload.write(data)
+        upload.commit()
+
+    def read(self, name: str) -> bytes:
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def delete(self, name: str):
+        path = self._path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def name_from_url(self, url: str):
+        """Nombre del blob para una URL de este almacenamiento; None si la URL es externa."""
+        prefix = f"{self.base_url}/"
+        return url[len(prefix):] if url and url.startswith(prefix) else None
+
+
+class AzureBlobUpload:
+    """Sube el blob por bloques (stage_block) a medida que llegan los datos."""
+
+    def __init__(self, blob_client, content_type: str):
+        self.blob_client = blob_client
+        self.content_type = content_type
+        self.block_ids = []
+
+    def write(self, data: bytes):
+        block_id = base64.b64encode(f"{len(self.block_ids):08d}".encode()).decode()
+        self.blob_client.stage_block(block_id=block_id, data=data)
+        self.block_ids.append(block_id)
+
+    def commit(self):
+        from azure.storage.blob import BlobBlock, ContentSettings
+
+        self.blob_client.commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in self.block_ids],
+            content_settings=ContentSettings(content_type=self.content_type),
+        )
+
+    def abort(self):
+        # Los bloques sin confirmar los elimina Azure automáticamente.
+        self.block_ids = []
+
+
+class AzureBlobBackend:
+    def __init__(self, connection_string: str, container: str):
+        from azure.storage.blob import BlobServiceClient
+
+        self.container_client = BlobServiceClient.from_connection_string(
+            connection_string
+        ).get_container_client(container)
+
+    def begin_upload(self, name: str, content_type: str):
+        return AzureBlobUpload(self.container_client.get_blob_client(name), content_type)
+
+    def put(self, name: str, data: bytes, content_type: str):
+        from azure.storage.blob import ContentSettings
+
+        self.container_client.get_blob_client(name).upload_blob(
+            data, overwrite=True, content_settings=ContentSettings(content_type=content_type)
+        )
+
+    def read(self, name: str) -> bytes:
+        return self.container_client.get_blob_client(name).download_blob().readall()
+
+    def delete(self, name: str):
+        self.container_client.get_blob_client(name).delete_blob()
+
+    def url(self, name: str) -> str:
+        return self.container_client.get_blob_client(name).url
+
+    def name_from_url(self, url: str):
+        prefix = f"{self.container_client.url.rstrip('/')}/"
+        return unquote(url[len(prefix):]) if url and url.startswith(prefix) else None
+
+
+def storage_config() -> dict:
+    """Configuración serializable para reconstruir el backend en otros procesos."""
+    if blob_backend == "local":
+        return {"kind": "local", "root": local_blob_root, "base_url": local_blob_base_url}
+    return {"kind": "azure", "connection_string": blob_connection_string, "container": blob_container}
+
+
+def create_backend(config: dict):
+    if config["kind"] == "local":
+        return LocalBlobBackend(config["root"], config["base_url"])
+    return AzureBlobBackend(config["connection_string"], config["container"])
+
+
+_backend = None
+
+def get_blob_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend(storage_config())
+    return _backend